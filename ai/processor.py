@@ -6,6 +6,8 @@ import asyncio
 import logging
 import re
 import json
+import random
+import orjson
 import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
@@ -15,6 +17,24 @@ from utils.metrics import metrics_collector, track_function
 
 logger = logging.getLogger(__name__)
 
+# Параметры экспоненциальной задержки между повторами (секунды)
+_RETRY_BASE_DELAY = 0.5
+_RETRY_MAX_DELAY = 8.0
+_RETRY_JITTER = 0.25
+# Верхняя граница для Retry-After от сервера
+_RETRY_AFTER_MAX = 30.0
+
+async def _read_json(response: aiohttp.ClientResponse) -> Any:
+    """Читает тело ответа целиком и декодирует JSON через orjson"""
+    return orjson.loads(await response.read())
+
+class RateLimitError(Exception):
+    """Ответ 429 от OpenRouter; retry_after - значение заголовка Retry-After (если был)"""
+    
+    def __init__(self, message: str, retry_after: Optional[str] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
 class AIProcessor:
     """Процессор для работы с ИИ через OpenRouter API"""
     
@@ -22,15 +42,51 @@ class AIProcessor:
         self.api_key = api_key
         self.model = model
         self.base_url = "https://openrouter.ai/api/v1"
+        self.chat_completions_url = f"{self.base_url}/chat/completions"
         self.session = None
         self.cooldowns = {}  # Кулдауны для пользователей
         
         logger.info(f"🧠 AIProcessor инициализирован с моделью: {model}")
     
+    @staticmethod
+    def retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+        """Задержка перед повтором: Retry-After от сервера или экспонента с джиттером"""
+        if retry_after:
+            try:
+                return min(float(retry_after), _RETRY_AFTER_MAX)
+            except ValueError:
+                pass  # HTTP-дата вместо секунд - используем экспоненту
+        return min(_RETRY_MAX_DELAY, _RETRY_BASE_DELAY * 2 ** attempt) + random.uniform(0, _RETRY_JITTER)
+    
+    def build_chat_payload(self, prompt: str, max_tokens: int = 4000) -> Dict[str, Any]:
+        """Собирает тело запроса chat/completions с общими параметрами генерации"""
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "frequency_penalty": 0.1,
+            "presence_penalty": 0.1
+        }
+    
     async def _get_session(self) -> aiohttp.ClientSession:
         """Получает или создает HTTP сессию"""
         if self.session is None or self.session.closed:
+            # Пул keep-alive соединений и кэш DNS - без нового TCP/TLS рукопожатия на каждый запрос
+            connector = aiohttp.TCPConnector(
+                limit=64,
+                limit_per_host=32,
+                ttl_dns_cache=300,
+                keepalive_timeout=75
+            )
             self.session = aiohttp.ClientSession(
+                connector=connector,
                 headers={
                     "Authorization": f"Bearer {self.api_key}",
                     "Content-Type": "application/json",
@@ -41,34 +97,45 @@ class AIProcessor:
             )
         return self.session
     
+    async def post_chat_completion(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Отправляет payload в chat/completions и возвращает декодированный JSON ответа
+        
+        Ошибочный статус - исключение (RateLimitError для 429), повторы остаются за вызывающим.
+        """
+        session = await self._get_session()
+        
+        async with session.post(self.chat_completions_url, json=payload) as response:
+            if response.status == 200:
+                return await _read_json(response)
+            
+            if response.status == 429:
+                raise RateLimitError("Rate limit превышен для OpenRouter API", response.headers.get('Retry-After'))
+            
+            error_text = await response.text()
+            if response.status >= 500:
+                raise Exception(f"Серверная ошибка OpenRouter API ({response.status}): {error_text[:200]}")
+            raise Exception(f"Ошибка OpenRouter API ({response.status}): {error_text}")
+    
     @track_function("call_openrouter_api")
     async def call_openrouter_api(self, prompt: str, max_tokens: int = 4000, max_retries: int = 3) -> str:
         """Отправляет запрос к OpenRouter API с retry логикой"""
         
-        payload = {
-            "model": self.model,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "max_tokens": max_tokens,
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "frequency_penalty": 0.1,
-            "presence_penalty": 0.1
-        }
+        payload = self.build_chat_payload(prompt, max_tokens)
         
         for attempt in range(max_retries):
             try:
                 session = await self._get_session()
+                # Пауза перед повтором - выдерживается уже после выхода из async with,
+                # чтобы соединение не удерживалось в пуле на время ожидания
+                delay = None
                 
-                logger.info(f"🤖 Отправляем запрос к OpenRouter API (модель: {self.model}, попытка {attempt + 1}/{max_retries})")
+                # Диагностика на каждую попытку - ленивое форматирование, только в DEBUG
+                logger.debug("🤖 Отправляем запрос к OpenRouter API (модель: %s, попытка %d/%d)",
+                             self.model, attempt + 1, max_retries)
                 
-                async with session.post(f"{self.base_url}/chat/completions", json=payload) as response:
+                async with session.post(self.chat_completions_url, json=payload) as response:
                     if response.status == 200:
-                        data = await response.json()
+                        data = await _read_json(response)
                         
                         if 'choices' in data and len(data['choices']) > 0:
                             content = data['choices'][0]['message']['content']
@@ -89,9 +156,8 @@ class AIProcessor:
                         logger.warning(f"Rate limit превышен для OpenRouter API (попытка {attempt + 1}/{max_retries})")
                         if attempt == max_retries - 1:
                             return "Извините, сервер перегружен. Попробуйте через несколько минут."
-                        # Убираем задержки для максимальной скорости
-                        # await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                        continue
+                        # Повтор без паузы только усиливает rate limit - ждем по Retry-After или с backoff
+                        delay = self.retry_delay(attempt, response.headers.get('Retry-After'))
                         
                     elif response.status >= 500:
                         # Серверные ошибки - можно повторить попытку
@@ -99,28 +165,30 @@ class AIProcessor:
                         logger.warning(f"Серверная ошибка OpenRouter API ({response.status}): {error_text[:200]} (попытка {attempt + 1}/{max_retries})")
                         if attempt == max_retries - 1:
                             return "Извините, произошла ошибка на сервере ИИ. Попробуйте позже."
-                        # Убираем задержки для максимальной скорости
-                        # await asyncio.sleep(1)  # Короткая пауза при серверных ошибках
-                        continue
+                        delay = self.retry_delay(attempt, response.headers.get('Retry-After'))
                         
                     else:
                         # Клиентские ошибки - не повторяем
                         error_text = await response.text()
                         logger.error(f"Ошибка OpenRouter API ({response.status}): {error_text}")
                         return "Извините, произошла ошибка при обращении к ИИ. Попробуйте позже."
+                
+                if delay is not None:
+                    await asyncio.sleep(delay)
+                continue
                         
             except asyncio.TimeoutError:
                 logger.warning(f"Таймаут при обращении к OpenRouter API (попытка {attempt + 1}/{max_retries})")
                 if attempt == max_retries - 1:
                     return "Извините, превышено время ожидания ответа. Попробуйте позже."
+                await asyncio.sleep(self.retry_delay(attempt))
                 continue
                 
             except aiohttp.ClientError as e:
                 logger.warning(f"Ошибка соединения с OpenRouter API: {e} (попытка {attempt + 1}/{max_retries})")
                 if attempt == max_retries - 1:
                     return "Извините, проблемы с соединением. Попробуйте позже."
-                # Убираем задержки для максимальной скорости
-                # await asyncio.sleep(1)
+                await asyncio.sleep(self.retry_delay(attempt))
                 continue
                 
             except Exception as e:
@@ -170,7 +238,7 @@ class AIProcessor:
                         link_mark = f"[📦 Заказать]({url})"
                         processed_response = processed_response.replace(full_match, link_mark)
                         
-                        logger.info(f"🔗 Добавлена ссылка для артикула: {article}")
+                        logger.debug("🔗 Добавлена ссылка для артикула: %s", article)
                     else:
                         logger.warning(f"⚠️ Не найден URL для артикула: {article}")
             
@@ -260,12 +328,12 @@ class AIProcessor:
                 "temperature": 0
             }
             
-            async with session.post(f"{self.base_url}/chat/completions", json=test_payload) as response:
+            async with session.post(self.chat_completions_url, json=test_payload) as response:
                 response_time = (datetime.now() - start_time).total_seconds()
                 status['response_time'] = round(response_time, 2)
                 
                 if response.status == 200:
-                    data = await response.json()
+                    data = await _read_json(response)
                     if 'choices' in data and len(data['choices']) > 0:
                         test_response = data['choices'][0]['message']['content'].strip().lower()
                         status['api_key_valid'] = True
@@ -1,55 +1,72 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from typing import Dict, List, Any
+from collections import Counter, defaultdict
+from functools import lru_cache
+from operator import itemgetter
+from typing import Dict, List, Any, Tuple
+
+# Подписи основных характеристик профиля: ключ профиля -> (значение ответа -> подпись)
+_PROFILE_LABELS = {
+    "gender": {"female": "женский", "male": "мужской", "unisex": "унисекс"},
+    "age_experience": {
+        "beginner": "новичок в парфюмерии", 
+        "intermediate": "средний опыт", 
+        "advanced": "продвинутый коллекционер"
+    },
+    "personality_type": {
+        "romantic": "романтическая натура",
+        "intellectual": "интеллектуальный тип",
+        "extrovert": "экстравертная личность",
+        "introvert": "интровертная личность"
+    }
+}
+
+# Значения по умолчанию для основных характеристик
+_PROFILE_DEFAULTS = {
+    "gender": "универсальный профиль",
+    "age_experience": "средний опыт",
+    "personality_type": "сбалансированная личность"
+}
+
+# Шапка описания профиля
+_PROFILE_HEADER_TEMPLATE = """ПРОФИЛЬ КЛИЕНТА:
+👤 **Гендерная принадлежность:** {gender}
+🎓 **Опыт с парфюмерией:** {age_experience}
+🧠 **Тип личности:** {personality_type}
 
-class PromptTemplates:
-    """Шаблоны промптов для ИИ с улучшенным форматированием - БЕЗ ОГРАНИЧЕНИЙ"""
+📋 **Детальные предпочтения:**"""
+
+@lru_cache(maxsize=256)
+def _describe_user_profile(profile_items: tuple) -> str:
+    """Создает детальное описание профиля по кортежу пар (ключ, значения)"""
+    # Плоский словарь для шапки и строки остальных характеристик - за один проход
+    profile_flat = dict(_PROFILE_DEFAULTS)
+    parts = [None]
     
-    @staticmethod
-    def create_perfume_question_prompt(user_question: str, perfumes_data: List[Dict[str, Any]]) -> str:
-        """Создает промпт для вопроса о парфюмах со ВСЕМИ данными каталога БЕЗ ОГРАНИЧЕНИЙ"""
-        
-        # Формируем ПОЛНЫЙ список парфюмов (все парфюмы)
-        perfumes_list = []
-        factory_analysis = {}
-        
-        for perfume in perfumes_data:  # БЕЗ ОГРАНИЧЕНИЙ
-            perfume_line = (
-                f"{perfume['name']} | "
-                f"{perfume['factory']} | "
-                f"{perfume['article']}"
-            )
-            perfumes_list.append(perfume_line)
-            
-            # Анализ фабрик для контекста - ВСЕ фабрики
-            factory = perfume['factory']
-            if factory not in factory_analysis:
-                factory_analysis[factory] = {'perfume_count': 0, 'quality_levels': set()}
-            factory_analysis[factory]['perfume_count'] += 1
-            if 'quality' in perfume:
-                factory_analysis[factory]['quality_levels'].add(perfume['quality'])
-        
-        # ВЕСЬ список парфюмов - без ограничений
-        all_perfumes = perfumes_list
-        
-        # Создаем ПОЛНУЮ сводку по ВСЕМ фабрикам
-        factory_summary = []
-        for factory, data in factory_analysis.items():  # ВСЕ фабрики
-            quality_info = ', '.join(list(data['quality_levels'])) if data['quality_levels'] else 'стандарт'
-            factory_summary.append(
-                f"- {factory}: {data['perfume_count']} ароматов, качество: {quality_info}"
-            )
-        
-        prompt = f"""Ты - эксперт-парфюмер и консультант по ароматам с 20-летним опытом.
+    for key, value in profile_items:
+        labels = _PROFILE_LABELS.get(key)
+        if labels is not None:
+            if isinstance(value, tuple) and value:
+                profile_flat[key] = labels.get(value[0], value[0])
+        elif isinstance(value, tuple):
+            key_formatted = key.replace("_", " ").title()
+            values_formatted = ", ".join(value) if value else "не указано"
+            parts.append(f"• {key_formatted}: {values_formatted}")
+    
+    parts[0] = _PROFILE_HEADER_TEMPLATE.format_map(profile_flat)
+    return "\n".join(parts)
+
+# Шаблон промпта для вопроса о парфюмах
+_PERFUME_QUESTION_TEMPLATE = """Ты - эксперт-парфюмер и консультант по ароматам с 20-летним опытом.
 
 ВОПРОС КЛИЕНТА: "{user_question}"
 
 ВСЕ ДОСТУПНЫЕ АРОМАТЫ (название + фабрика + артикул):
-{chr(10).join(all_perfumes)}
+{perfumes_text}
 
 ПОЛНЫЙ АНАЛИЗ ВСЕХ ФАБРИК:
-{chr(10).join(factory_summary)}
+{factories_text}
 
 ИНСТРУКЦИИ:
 1. Проанализируй запрос клиента и выбери 3-5 наиболее подходящих ароматов из ВСЕГО каталога
@@ -85,49 +102,9 @@ class PromptTemplates:
 - Не экранируй символы _ и * - они нужны для Markdown форматирования Telegram
 - Обязательно указывай артикул в формате [Артикул: XXX] для автоматического создания ссылок
 - Ссылки должны быть в формате [Заказать на aroma-euro.ru](URL)"""
-        
-        return prompt
-    
-    @staticmethod
-    def create_quiz_results_prompt(user_profile: Dict[str, Any], 
-                                 suitable_perfumes: List[Dict[str, Any]],
-                                 edwards_analysis: Dict[str, Any] = None) -> str:
-        """Создает улучшенный промпт для результатов квиза с персонализацией - ВЕСЬ КАТАЛОГ"""
-        
-        # Анализируем профиль пользователя
-        profile_summary = PromptTemplates._analyze_user_profile_detailed(user_profile)
-        
-        # Формируем ПОЛНЫЙ список ВСЕХ подходящих парфюмов - БЕЗ ОГРАНИЧЕНИЙ
-        perfumes_list = []
-        factory_analysis = {}
-        
-        for perfume in suitable_perfumes:  # ВСЕ парфюмы без ограничений
-            perfume_line = (
-                f"{perfume['name']} | "
-                f"{perfume['factory']} | "
-                f"{perfume['article']}"
-            )
-            perfumes_list.append(perfume_line)
-            
-            # Анализ ВСЕХ фабрик
-            factory = perfume['factory']
-            if factory not in factory_analysis:
-                factory_analysis[factory] = {'perfume_count': 0, 'quality_levels': set()}
-            factory_analysis[factory]['perfume_count'] += 1
-            if 'quality' in perfume:
-                factory_analysis[factory]['quality_levels'].add(perfume['quality'])
-        
-        # Создаем сводку по ВСЕМ фабрикам - без ограничений
-        all_factories = []
-        for factory, data in factory_analysis.items():  # ВСЕ фабрики
-            quality_info = ', '.join(list(data['quality_levels'])) if data['quality_levels'] else 'стандарт'
-            all_factories.append(
-                f"- {factory}: {data['perfume_count']} ароматов, качество: {quality_info}"
-            )
-        
-        perfumes_text = "\n".join(perfumes_list)
-        
-        prompt = f"""Ты - персональный парфюмерный консультант премиум-класса с экспертизой в психологии ароматов.
+
+# Шаблон промпта для результатов квиза
+_QUIZ_RESULTS_TEMPLATE = """Ты - персональный парфюмерный консультант премиум-класса с экспертизой в психологии ароматов.
 
 {profile_summary}
 
@@ -135,7 +112,7 @@ class PromptTemplates:
 {perfumes_text}
 
 ПОЛНЫЙ АНАЛИЗ ВСЕХ ФАБРИК:
-{chr(10).join(all_factories)}
+{factories_text}
 
 ЗАДАЧА:
 Создай персональную подборку из 5-7 ароматов, идеально подходящих этому клиенту из ВСЕГО доступного каталога.
@@ -180,14 +157,9 @@ class PromptTemplates:
 - Ссылки должны быть в формате [Заказать на aroma-euro.ru](URL)
 
 Рекомендации должны быть максимально персонализированными, практичными и обоснованными."""
-        
-        return prompt
-    
-    @staticmethod
-    def create_fragrance_info_prompt(fragrance_query: str) -> str:
-        """Создает промпт для получения информации об аромате"""
-        
-        prompt = f"""Ты - парфюмерный эксперт с энциклопедическими знаниями, автор книг о парфюмерии.
+
+# Шаблон промпта для информации об аромате
+_FRAGRANCE_INFO_TEMPLATE = """Ты - парфюмерный эксперт с энциклопедическими знаниями, автор книг о парфюмерии.
 
 ЗАПРОС: "{fragrance_query}"
 
@@ -234,56 +206,86 @@ class PromptTemplates:
 
 ВАЖНО: Используй *курсив* для заголовков и **жирный** для ключевых терминов. Не экранируй символы _ и * - они нужны для Markdown форматирования Telegram."""
 
-        return prompt
+def _summarize_catalog(perfumes: List[Dict[str, Any]]) -> Tuple[str, str]:
+    """Строки списка ароматов и сводка по фабрикам (число ароматов и уровни качества)"""
+    perfumes_text = "\n".join(
+        f"{perfume['name']} | {perfume['factory']} | {perfume['article']}" for perfume in perfumes
+    )
+    
+    # Подсчет ароматов по фабрикам в C; порядок фабрик - по первому появлению
+    factory_counts = Counter(map(itemgetter('factory'), perfumes))
+    factory_qualities = defaultdict(set)
+    for perfume in perfumes:
+        if 'quality' in perfume:
+            factory_qualities[perfume['factory']].add(perfume['quality'])
+    
+    factory_summary = []
+    for factory, count in factory_counts.items():
+        qualities = factory_qualities.get(factory)
+        quality_info = ', '.join(qualities) if qualities else 'стандарт'
+        factory_summary.append(f"- {factory}: {count} ароматов, качество: {quality_info}")
+    
+    return perfumes_text, "\n".join(factory_summary)
 
+class PromptTemplates:
+    """Шаблоны промптов для ИИ с улучшенным форматированием - БЕЗ ОГРАНИЧЕНИЙ"""
+    
     @staticmethod
-    def _analyze_user_profile_detailed(user_profile: Dict[str, Any]) -> str:
-        """Создает детальное описание профиля пользователя"""
+    def create_perfume_question_prompt(user_question: str, perfumes_data: List[Dict[str, Any]]) -> str:
+        """Создает промпт для вопроса о парфюмах со ВСЕМИ данными каталога БЕЗ ОГРАНИЧЕНИЙ"""
         
-        # Извлекаем основные характеристики
-        gender = "универсальный профиль"
-        age_experience = "средний опыт"
-        personality = "сбалансированная личность"
+        # ПОЛНЫЙ список парфюмов и сводка по ВСЕМ фабрикам - без ограничений
+        perfumes_text, factories_text = _summarize_catalog(perfumes_data)
         
-        # Обрабатываем различные форматы данных профиля
-        if isinstance(user_profile, dict):
-            # Новый формат с блоками
-            for key, value in user_profile.items():
-                if key == "gender" and isinstance(value, list) and value:
-                    gender_map = {"female": "женский", "male": "мужской", "unisex": "унисекс"}
-                    gender = gender_map.get(value[0], value[0])
-                elif key == "age_experience" and isinstance(value, list) and value:
-                    exp_map = {
-                        "beginner": "новичок в парфюмерии", 
-                        "intermediate": "средний опыт", 
-                        "advanced": "продвинутый коллекционер"
-                    }
-                    age_experience = exp_map.get(value[0], value[0])
-                elif key == "personality_type" and isinstance(value, list) and value:
-                    pers_map = {
-                        "romantic": "романтическая натура",
-                        "intellectual": "интеллектуальный тип",
-                        "extrovert": "экстравертная личность",
-                        "introvert": "интровертная личность"
-                    }
-                    personality = pers_map.get(value[0], value[0])
+        prompt = _PERFUME_QUESTION_TEMPLATE.format(
+            user_question=user_question,
+            perfumes_text=perfumes_text,
+            factories_text=factories_text
+        )
         
-        # Собираем полное описание профиля
-        profile_description = f"""ПРОФИЛЬ КЛИЕНТА:
-👤 **Гендерная принадлежность:** {gender}
-🎓 **Опыт с парфюмерией:** {age_experience}
-🧠 **Тип личности:** {personality}
-
-📋 **Детальные предпочтения:**"""
+        return prompt
+    
+    @staticmethod
+    def create_quiz_results_prompt(user_profile: Dict[str, Any], 
+                                 suitable_perfumes: List[Dict[str, Any]],
+                                 edwards_analysis: Dict[str, Any] = None) -> str:
+        """Создает улучшенный промпт для результатов квиза с персонализацией - ВЕСЬ КАТАЛОГ"""
+        
+        # Анализируем профиль пользователя
+        profile_summary = PromptTemplates._analyze_user_profile_detailed(user_profile)
+        
+        # ПОЛНЫЙ список ВСЕХ подходящих парфюмов и сводка по ВСЕМ фабрикам - БЕЗ ОГРАНИЧЕНИЙ
+        perfumes_text, factories_text = _summarize_catalog(suitable_perfumes)
         
-        # Добавляем остальные характеристики
-        for key, value in user_profile.items():
-            if key not in ["gender", "age_experience", "personality_type"] and isinstance(value, list):
-                key_formatted = key.replace("_", " ").title()
-                values_formatted = ", ".join(value) if value else "не указано"
-                profile_description += f"\n• {key_formatted}: {values_formatted}"
+        prompt = _QUIZ_RESULTS_TEMPLATE.format(
+            profile_summary=profile_summary,
+            perfumes_text=perfumes_text,
+            factories_text=factories_text
+        )
         
-        return profile_description
+        return prompt
+    
+    @staticmethod
+    def create_fragrance_info_prompt(fragrance_query: str) -> str:
+        """Создает промпт для получения информации об аромате"""
+        
+        prompt = _FRAGRANCE_INFO_TEMPLATE.format(fragrance_query=fragrance_query)
+
+        return prompt
+
+    @staticmethod
+    def _analyze_user_profile_detailed(user_profile: Dict[str, Any]) -> str:
+        """Создает детальное описание профиля пользователя (с кэшированием)"""
+        # Хэшируемое представление профиля с сохранением порядка ключей
+        profile_items = tuple(
+            (key, tuple(value) if isinstance(value, list) else value)
+            for key, value in user_profile.items()
+        )
+        try:
+            return _describe_user_profile(profile_items)
+        except TypeError:
+            # Нехэшируемые значения - строим описание без кэша
+            return _describe_user_profile.__wrapped__(profile_items)
 
     @staticmethod
     def _analyze_user_profile(user_profile: Dict[str, Any]) -> str:
@@ -752,7 +752,13 @@ class DatabaseManager:
             return info
 
     def get_parser_statistics(self) -> Dict[str, Any]:
-        """Получает статистику работы парсера"""
+        """Получает статистику работы парсера (кэш на 60 секунд)"""
+        cache_key = "parser_statistics"
+        
+        # Проверяем кэш - статистика меняется только при новом запуске парсера
+        if self._is_cache_valid(cache_key, ttl=60):
+            return self._cache[cache_key]
+        
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
@@ -784,8 +790,8 @@ class DatabaseManager:
                     last_parse = cursor.fetchone()
                     if last_parse:
                         stats['last_parse_time'] = last_parse['created_at']
-                        stats['items_added_last_parse'] = last_parse.get('items_added', 0)
-                        stats['items_updated_last_parse'] = last_parse.get('items_updated', 0)
+                        stats['items_added_last_parse'] = last_parse['items_added'] or 0
+                        stats['items_updated_last_parse'] = last_parse['items_updated'] or 0
                     
                     # Общая статистика
                     cursor.execute("""
@@ -814,6 +820,10 @@ class DatabaseManager:
             except Exception as e:
                 stats['errors'].append(f"Ошибка при получении статистики парсера: {str(e)}")
             
+            # Кэшируем только успешный результат
+            if not stats['errors']:
+                self._set_cache(cache_key, stats, ttl=60)
+            
             return stats
 
     def _get_database_size(self) -> str:
@@ -873,6 +883,8 @@ class DatabaseManager:
                     execution_time, json.dumps(metadata) if metadata else None
                 ))
                 conn.commit()
+                # Новая запись - сбрасываем кэш статистики парсера
+                self._cache.pop("parser_statistics", None)
                 logger.info(f"📝 Логирование парсера: {status}, +{items_added}, ~{items_updated}")
         except Exception as e:
             logger.error(f"❌ Ошибка при логировании парсера: {e}")
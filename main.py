@@ -3,7 +3,6 @@
 
 import logging
 import asyncio
-import signal
 import sys
 import os
 import fcntl
@@ -75,16 +74,6 @@ class PerfumeBot:
             except Exception as e:
                 logger.error(f"Ошибка при освобождении блокировки: {e}")
 
-    def _setup_signal_handlers(self):
-        """Настраивает обработчики сигналов для корректного завершения"""
-        def signal_handler(signum, frame):
-            logger.info(f"🛑 Получен сигнал {signum}, завершаем работу...")
-            self._release_lock()
-            sys.exit(0)
-        
-        signal.signal(signal.SIGTERM, signal_handler)
-        signal.signal(signal.SIGINT, signal_handler)
-
     def _register_handlers(self):
         """Регистрирует все обработчики команд и сообщений"""
         # Простой тестовый обработчик
@@ -592,6 +581,7 @@ class PerfumeBot:
                 report += f"• Вызовов: {metrics['total_calls']}\n"
                 report += f"• Среднее время: {metrics['avg_time']}с\n"
                 report += f"• Мин/Макс: {metrics['min_time']}с / {metrics['max_time']}с\n"
+                report += f"• p50/p95/p99: {metrics['p50_time']}с / {metrics['p95_time']}с / {metrics['p99_time']}с\n"
                 report += f"• Успешность: {metrics['success_rate']}%\n"
                 if metrics['last_execution_time']:
                     report += f"• Последний вызов: {metrics['last_execution_time']}с\n"
@@ -1215,6 +1205,14 @@ class PerfumeBot:
             logger.error(f"❌ Ошибка запуска планировщика парсера: {e}")
             # Парсер не критичен для работы бота, поэтому продолжаем
 
+    async def _post_shutdown_callback(self, application):
+        """Callback для освобождения ресурсов после остановки бота"""
+        try:
+            await self.ai.close()
+            logger.info("🔌 HTTP сессия AIProcessor закрыта")
+        except Exception as e:
+            logger.error(f"❌ Ошибка при закрытии HTTP сессии: {e}")
+
     def run(self):
         """Запускает бота"""
         try:
@@ -1223,16 +1221,16 @@ class PerfumeBot:
                 logger.error("❌ Бот уже запущен! Завершаем работу.")
                 sys.exit(1)
             
-            # Настраиваем обработчики сигналов
-            self._setup_signal_handlers()
-            
             # Настраиваем post_init callback для автозапуска парсера
             self.application.post_init = self._post_init_callback
+            self.application.post_shutdown = self._post_shutdown_callback
             
             logger.info("🚀 Perfume Bot запущен и готов к работе!")
             
             # Запускаем polling с логированием
             logger.info("📡 Запускаем polling для получения обновлений...")
+            # Сигналы по умолчанию (SIGINT/SIGTERM/SIGABRT) PTB обрабатывает в event loop:
+            # polling корректно останавливается, блокировка снимается в finally
             self.application.run_polling(drop_pending_updates=True)
             
         except KeyboardInterrupt:
@@ -1246,9 +1244,21 @@ class PerfumeBot:
 
 
 
+def _install_uvloop():
+    """Включает uvloop как event loop, если он установлен"""
+    try:
+        import uvloop
+    except ImportError:
+        logger.info("ℹ️ uvloop не установлен, используется стандартный asyncio loop")
+        return
+    uvloop.install()
+    logger.info("⚡ uvloop включен")
+
 def main():
     """Главная функция"""
     bot = None
+    # Должно выполняться до создания event loop в run_polling
+    _install_uvloop()
     try:
         bot = PerfumeBot()
         bot.run()
@@ -4,17 +4,31 @@
 import asyncio
 import schedule
 import logging
-import json
+import orjson
 import hashlib
 import time
 import os
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 
+from lxml import etree, html as lxml_html
+
 from parsers.data_processor import DataProcessor
 
 logger = logging.getLogger(__name__)
 
+def _xpath_div_with_class(class_name: str) -> etree.XPath:
+    """Компилирует XPath для div с CSS-классом (аналог soup.find('div', class_=...))"""
+    return etree.XPath(
+        f"(//div[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')])[1]"
+    )
+
+# Контейнеры с товарами на странице каталога (в порядке приоритета), компилируются один раз
+_PRODUCTS_CONTAINER_XPATHS = (
+    _xpath_div_with_class('products-list'),
+    _xpath_div_with_class('catalog-items'),
+)
+
 class AutoParser:
     """Автоматический парсер для регулярного обновления каталога"""
     
@@ -129,8 +143,9 @@ class AutoParser:
                 raise Exception(f"Файл {json_file} не найден")
             
             # Парсим данные
-            with open(json_file, 'r', encoding='utf-8') as f:
-                catalog_data = json.load(f)
+            # orjson разбирает байты напрямую - без промежуточного декодирования в str
+            with open(json_file, 'rb') as f:
+                catalog_data = orjson.loads(f.read())
             
             result['total_items_in_source'] = len(catalog_data)
             
@@ -283,8 +298,9 @@ class AutoParser:
         try:
             json_file = "full_perfumes_catalog_complete.json"
             
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            # orjson разбирает байты напрямую - без промежуточного декодирования в str
+            with open(json_file, 'rb') as f:
+                data = orjson.loads(f.read())
             
             if 'perfumes' in data:
                 perfumes_data = data['perfumes']
@@ -367,15 +383,15 @@ class AutoParser:
         """Парсит каталог и сохраняет в БД"""
         try:
             # Импортируем оригинальный парсер
-            from complete_parser_with_details import CompleteParfumeParser
+            from parsers.complete_parser_with_details import CompleteParfumeParser
             
             logger.info("🕷️ Запускаем парсинг с сайта aroma-euro.ru...")
             
             # Создаем экземпляр парсера
             parser = CompleteParfumeParser(max_workers=3)
             
-            # Парсим каталог
-            raw_perfumes = parser.parse_all_catalog()
+            # Парсим каталог в отдельном потоке - блокирующие HTTP запросы не держат event loop бота
+            raw_perfumes = await asyncio.to_thread(parser.parse_all_catalog)
             
             if not raw_perfumes:
                 logger.warning("⚠️ Парсер не вернул данных")
@@ -434,22 +450,34 @@ class AutoParser:
         try:
             # Упрощенная проверка - проверяем хэш первой страницы каталога
             import requests
-            from bs4 import BeautifulSoup
             
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
             
-            response = requests.get('https://aroma-euro.ru/perfume/', headers=headers, timeout=10)
+            response = requests.get('https://aroma-euro.ru/perfume/', headers=headers, timeout=10, stream=True)
             if response.status_code == 200:
-                # Создаем хэш контента страницы
-                soup = BeautifulSoup(response.content, 'html.parser')
+                # Потоково скармливаем байты C-парсеру lxml - разбор идет параллельно загрузке,
+                # без промежуточной копии всей страницы в памяти
+                content_type = response.headers.get('Content-Type', '').lower()
+                encoding = response.encoding if 'charset' in content_type else 'utf-8'
+                parser = lxml_html.HTMLParser(encoding=encoding)
+                with response:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        parser.feed(chunk)
+                root = parser.close()
                 
                 # Ищем контейнер с товарами
-                products_container = soup.find('div', class_='products-list') or soup.find('div', class_='catalog-items')
+                products_container = None
+                for find_container in _PRODUCTS_CONTAINER_XPATHS:
+                    found = find_container(root)
+                    if found:
+                        products_container = found[0]
+                        break
                 
-                if products_container:
-                    content_hash = hashlib.md5(str(products_container).encode()).hexdigest()
+                if products_container is not None:
+                    # Создаем хэш контента контейнера
+                    content_hash = hashlib.md5(etree.tostring(products_container, method='html')).hexdigest()
                     
                     if self.last_catalog_hash is None:
                         self.last_catalog_hash = content_hash
@@ -464,6 +492,7 @@ class AutoParser:
                     logger.warning("Не удалось найти контейнер с товарами на странице")
                     return True  # В случае сомнений лучше обновить
             else:
+                response.close()
                 logger.warning(f"Ошибка при проверке каталога: {response.status_code}")
                 return False
                 
@@ -2,15 +2,22 @@
 # -*- coding: utf-8 -*-
 
 import requests
-from bs4 import BeautifulSoup
-import json
+from bs4 import BeautifulSoup, SoupStrainer
+from lxml import etree
+import orjson
 import re
+import sys
 import time
 import logging
 from typing import List, Dict, Optional, Tuple
 from urllib.parse import urljoin, urlparse
 from datetime import datetime
 import concurrent.futures
+import multiprocessing
+import os
+from collections import Counter
+from itertools import islice
+from functools import lru_cache
 from threading import Lock
 
 # Настройка логирования
@@ -24,10 +31,282 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Паттерны для поиска фабрик и артикулов в конце названия (компилируются один раз)
+_FACTORY_PATTERNS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    # Givaudan Premium/SuperLux
+    r',\s*(Givaudan Premium|Givaudan SuperLux)\s*$',
+    # SELUZ
+    r',\s*(SELUZ|Seluz)\s*$',
+    # Argeville
+    r',\s*(Argeville)\s*$',
+    # Lz с артикулом
+    r',\s*(Lz)\s+(\d+[\d\-T]*)\s*$',
+    r',\s*(Lz)\s+(\d+[\d\-/\s]*)\s*$',
+    # Просто Lz
+    r',\s*(Lz)\s*$',
+    # Другие фабрики
+    r',\s*(Bin Tammam|EPS|Hamidi|Iberchem|LZ AG|MG Gulcicek|Reiha|LUZI|Luzi)\s*([^,]*?)\s*$'
+))
+
+# Пометка "(мотив ...)" в названии товара
+_MOTIV_RE = re.compile(r'\s*\(мотив[^)]*\)\s*')
+# Повторяющиеся пробелы
+_WHITESPACE_RE = re.compile(r'\s+')
+# Название вида "Бренд - Название"
+_TITLE_DASH_RE = re.compile(r'^([^-]+?)\s*-\s*(.+)$')
+# Класс элемента с ценой
+_PRICE_CLASS_RE = re.compile(r'price')
+# Класс карточки товара в сетке каталога (CS-Cart)
+_PRODUCT_CARD_CLASS = 'ty-grid-list__item'
+# Сколько уровней вверх от ссылки искать цену, если карточка не найдена (глубина карточки)
+_PRICE_PARENT_DEPTH = 3
+
+# Номер страницы в ссылке пагинации
+_PAGINATION_PAGE_RE = re.compile(r'/perfume/page-(\d+)/')
+
+# Подписи характеристик товара -> поле details (проверяются по порядку)
+_FEATURE_LABELS = (
+    ('артикул', 'article'),
+    ('качество', 'quality'),
+    ('бренд', 'brand_detailed'),
+    ('пол', 'gender'),
+    ('группа аромата', 'fragrance_group'),
+    ('фабрика', 'factory_detailed'),
+)
+
+# Фильтр разбора: в дерево попадает только блок характеристик (класс - один из токенов атрибута)
+_FEATURES_BLOCK_ONLY = SoupStrainer('div', class_=re.compile(r'(?:^|\s)ty-features-list(?:\s|$)'))
+
+# Известные бренды для лучшего парсинга
+_KNOWN_BRANDS = (
+    'Abdul Samad Al Qurashi', 'Acqua di Parma', 'Afnan', 'Ajmal', 'Al Haramain', 'Al Rehab',
+    'Al-Jazeera', 'Alexandre.j', 'Amouage', 'Anna Sui', 'Antonio Banderas', 'Arabian Oud',
+    'Ard al Zaafaran', 'Ariana Grande', 'Armand Basi', 'Atelier Cologne', 'Atkinsons',
+    'Attar Collection', 'Avon', 'Azzaro', 'BDK', 'Bharara', 'Boadicea The Victorius',
+    'Bond №9', 'Bottega Veneta', 'Brioni', 'Britney Spears', 'Burberry', 'Bvlgari',
+    'Byredo', 'Cacharel', 'Calvin Klein', 'Canali', 'Carolina Herrera', 'Caron',
+    'Cartier', 'Chanel', 'Chloe', 'Christian Dior', 'Clinique', 'Clive Christian',
+    'Creed', 'Cristiano Ronaldo', 'David Beckham', 'Davidoff', 'Dolce&Gabbana',
+    'Donna Karan', 'Dunhill', 'Elizabeth Arden', 'Escada', 'Escentric Molecules',
+    'Essential Parfums', 'Ex Nihilo', 'Fendi', 'Floraiku', 'Franck Boclet',
+    'Franck Olivier', 'Frederic Malle', 'Genyum', 'Giardini Di Toscana',
+    'Giorgio Armani', 'Gissah', 'Givaudan', 'Givenchy', 'Gucci', 'Guerlain',
+    'Hamidi', 'Haute Fragrance', 'Hermes', 'Hugo Boss', 'Ibraheem AlQurashi',
+    'Initio Parfums', 'IXORA', 'Jacques Bogart', 'Jean Paul Gaultier',
+    'Jimmy Choo', 'Jo Malone', 'Johan B.', 'Juliette Has A Gun', 'Junaid Perfumes',
+    'Kajal', 'Kayali Fragrances', 'Kenzo', 'Khalis', 'Khaltat', 'Kilian',
+    'Lacoste', 'Lalique', 'Lancome', 'Lanvin', 'Le Labo', 'Louis Vuitton',
+    'Maison Crivelli', 'Maison Francis Kurkdjian', 'Mancera', 'Marc-Antoine Barrois',
+    'Matiere Premiere', 'Memo', 'Molton Brown', 'Montale', 'Montblanc',
+    'Moschino', 'Narciso Rodriguez', 'Nasomatto', 'Nicolai Parfumeur Createur',
+    'Nina Ricci', 'Nishane', 'Ormonde Jayne', 'Orto Parisi', 'Paco Rabanne',
+    'Parfums De Marly', 'Paris World Luxury', 'Penhaligon\'s', 'Perfumer\'s Workshop',
+    'Prada', 'Rasasi', 'Reef Perfumes', 'Reiha', 'Renegades', 'Richard',
+    'Roja Dove', 'Rosendo Mateu', 'Rubeus Milano', 'Saab', 'Salvatore Ferragamo',
+    'Serge Lutens', 'Shaik', 'Surrati Perfumes', 'Swiss Arabian', 'Tauer Perfumes',
+    'Thameen', 'The House of Oud', 'Thomas Kosmala', 'Tiziana terenzi', 'Tom Ford',
+    'Trussardi', 'Van Cleef & Arpels', 'Versace', 'Vertus', 'Victoria Secret',
+    'Victoria\'s Secret', 'Viktor&Rolf', 'Vilhelm Parfumerie', 'Widian', 'Xerjoff',
+    'Yves Saint Laurent', 'Zadig & Voltaire', 'Zahra Perfumes', 'Zarkoperfume'
+)
+
+# Все бренды в одной альтернации: один проход regex-движка вместо цикла по брендам.
+# Длинные названия идут первыми, поэтому побеждает самое длинное совпадение
+_BRANDS_BY_LENGTH = sorted(_KNOWN_BRANDS, key=len, reverse=True)
+_BRAND_RE = re.compile(r'^(' + '|'.join(map(re.escape, _BRANDS_BY_LENGTH)) + r')\s+', re.IGNORECASE)
+# Найденный текст (в любом регистре) -> каноническое название бренда
+_BRAND_BY_LOWER = {brand.lower(): brand for brand in reversed(_BRANDS_BY_LENGTH)}
+
+def _extract_factory_info(title: str) -> Tuple[str, str, str]:
+    """
+    Извлекает информацию о фабрике из названия товара
+    Возвращает: (оригинальное_название, фабрика, артикул)
+    """
+    factory = ""
+    article = ""
+    clean_title = title
+
+    for pattern in _FACTORY_PATTERNS:
+        match = pattern.search(title)
+        if match:
+            factory = match.group(1)
+            if len(match.groups()) > 1 and match.group(2):
+                article = match.group(2).strip()
+            # Удаляем найденную фабрику из названия (паттерн привязан к концу строки)
+            clean_title = (title[:match.start()] + title[match.end():]).strip()
+            break
+
+    return clean_title, factory, article
+
+# Разбор названия зависит только от строки - повторные названия берутся из кэша
+@lru_cache(maxsize=8192)
+def _parse_title_and_brand(title: str) -> Tuple[str, str, str, str]:
+    """
+    Парсит название, извлекая бренд, название аромата, фабрику и артикул
+    Возвращает: (бренд, название_аромата, фабрика, артикул)
+    """
+    # Сначала извлекаем информацию о фабрике
+    clean_title, factory, article = _extract_factory_info(title)
+
+    # Убираем "(мотив)" и подобные пометки
+    clean_title = _MOTIV_RE.sub(' ', clean_title).strip()
+    clean_title = _WHITESPACE_RE.sub(' ', clean_title)  # Убираем лишние пробелы
+
+    brand = ""
+    perfume_name = clean_title
+
+    # Ищем известные бренды в начале названия
+    brand_match = _BRAND_RE.match(clean_title)
+    if brand_match:
+        brand = _BRAND_BY_LOWER[brand_match.group(1).lower()]
+        perfume_name = clean_title[brand_match.end():].strip()
+
+    # Если бренд не найден, пробуем другие паттерны
+    if not brand:
+        # Паттерн: "Бренд - Название"
+        dash_match = _TITLE_DASH_RE.match(clean_title)
+        if dash_match:
+            potential_brand = dash_match.group(1).strip()
+            if len(potential_brand.split()) <= 3:  # Бренд обычно не более 3 слов
+                brand = potential_brand
+                perfume_name = dash_match.group(2).strip()
+
+        # Паттерн: первые 1-2 слова как бренд
+        if not brand:
+            words = clean_title.split()
+            if len(words) >= 2:
+                # Пробуем первые 2 слова
+                potential_brand = ' '.join(words[:2])
+                if any(char.isupper() for char in potential_brand):
+                    brand = potential_brand
+                    perfume_name = ' '.join(words[2:]) if len(words) > 2 else words[-1]
+                else:
+                    # Пробуем первое слово
+                    brand = words[0]
+                    perfume_name = ' '.join(words[1:])
+
+    # Бренды и фабрики повторяются в тысячах записей - храним по одному объекту строки
+    return sys.intern(brand), perfume_name, sys.intern(factory), article
+
+def _create_unique_key(brand: str, name: str, factory: str, article: str) -> str:
+    """
+    Создает уникальный ключ для товара с учетом фабрики
+    """
+    # Нормализуем данные
+    brand_norm = brand.lower().strip()
+    name_norm = name.lower().strip()
+    factory_norm = factory.lower().strip()
+
+    # Ключ включает бренд, название и фабрику
+    return f"{brand_norm}|{name_norm}|{factory_norm}"
+
+def _parse_catalog_html(content: bytes, encoding: Optional[str], base_url: str) -> List[Dict[str, str]]:
+    """Разбирает HTML страницы каталога в список товаров
+    
+    Функция модульного уровня (сериализуется pickle) - выполняется в пуле процессов.
+    """
+    soup = BeautifulSoup(content, 'lxml', from_encoding=encoding)
+    perfumes = []
+    product_links = soup.find_all('a', class_='product-title')
+    
+    for link in product_links:
+        try:
+            # Извлекаем название
+            title = link.get_text(strip=True)
+            if not title:
+                continue
+
+            # Парсим название
+            brand, perfume_name, factory, article = _parse_title_and_brand(title)
+
+            # URL товара
+            product_url = link.get('href')
+            if product_url:
+                if product_url.startswith('/'):
+                    product_url = urljoin(base_url, product_url)
+
+            # Ищем цену
+            price = ""
+            price_element = None
+
+            # Сначала одним запросом в карточке товара
+            card = link.find_parent('div', class_=_PRODUCT_CARD_CLASS)
+            if card is not None:
+                price_element = card.find(class_=_PRICE_CLASS_RE)
+
+            # Запасной путь - ищем цену в родительских элементах
+            if not price_element:
+                current = link
+                for _ in range(_PRICE_PARENT_DEPTH):
+                    current = current.parent
+                    if not current:
+                        break
+
+                    price_element = current.find(class_=_PRICE_CLASS_RE)
+                    if price_element:
+                        break
+
+            if price_element:
+                price = price_element.get_text(strip=True)
+
+            perfume_info = {
+                'full_title': title,
+                'brand': brand,
+                'name': perfume_name,
+                'factory': factory,
+                'article': article,
+                'url': product_url,
+                'price': price,
+                'unique_key': _create_unique_key(brand, perfume_name, factory, article),
+                # Подробные характеристики будут добавлены позже
+                'details': {}
+            }
+
+            perfumes.append(perfume_info)
+
+        except Exception as e:
+            logger.error(f"Ошибка при обработке товара: {e}")
+            continue
+
+    return perfumes
+
+def _is_product_link(element) -> bool:
+    """Ссылка на товар в каталоге: <a> с CSS-классом product-title"""
+    return 'product-title' in (element.get('class') or '').split()
+
+def _declared_encoding(response: requests.Response) -> Optional[str]:
+    """Кодировка из Content-Type, только если charset указан явно
+    
+    Без charset requests подставляет ISO-8859-1 - тогда возвращаем None,
+    и lxml определяет кодировку по <meta charset> страницы.
+    """
+    content_type = response.headers.get('Content-Type', '').lower()
+    return response.encoding if 'charset' in content_type else None
+
+def _create_session() -> requests.Session:
+    """HTTP-сессия парсера; при AROMA_USE_CACHE=1 - с дисковым кэшем ответов для повторных прогонов"""
+    if os.getenv('AROMA_USE_CACHE') != '1':
+        return requests.Session()
+    
+    try:
+        from requests_cache import CachedSession
+    except ImportError:
+        logger.warning("⚠️ AROMA_USE_CACHE=1, но requests-cache не установлен - работаем без кэша")
+        return requests.Session()
+    
+    logger.info("💾 Кэш HTTP-ответов включен: aroma_cache.sqlite (1 час)")
+    return CachedSession(
+        'aroma_cache',
+        backend='sqlite',
+        expire_after=3600,
+        allowable_codes=(200,),
+        cache_control=True  # Заголовки Cache-Control сервера имеют приоритет
+    )
+
 class CompleteParfumeParser:
-    def __init__(self, max_workers=3):
+    def __init__(self, max_workers=3, parse_in_processes=False):
         self.base_url = "https://aroma-euro.ru"
-        self.session = requests.Session()
+        self.session = _create_session()
         # Убираем Accept-Encoding для избежания проблем с сжатием
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -37,9 +316,20 @@ class CompleteParfumeParser:
             'Cache-Control': 'no-cache',
             'Pragma': 'no-cache'
         })
+        # С дисковым кэшем no-cache в запросе заставил бы requests-cache каждый раз идти в сеть
+        if hasattr(self.session, 'cache'):
+            del self.session.headers['Cache-Control']
+            del self.session.headers['Pragma']
+        # Пул keep-alive соединений не меньше числа потоков (страницы + детали работают одновременно)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(10, 2 * max_workers))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.perfumes = []
         self.max_workers = max_workers
         self.lock = Lock()
+        # Разбор страниц каталога в пуле процессов (создается на время parse_all_catalog)
+        self.parse_in_processes = parse_in_processes
+        self._parse_pool = None
         
         # Известные фабрики
         self.known_factories = [
@@ -47,147 +337,73 @@ class CompleteParfumeParser:
             'Hamidi', 'Iberchem', 'LZ AG', 'Lz', 'LZ', 'MG Gulcicek', 'Reiha', 
             'Argeville', 'SELUZ', 'Seluz', 'LUZI', 'Luzi'
         ]
-        
-        # Известные бренды для лучшего парсинга
-        self.known_brands = [
-            'Abdul Samad Al Qurashi', 'Acqua di Parma', 'Afnan', 'Ajmal', 'Al Haramain', 'Al Rehab',
-            'Al-Jazeera', 'Alexandre.j', 'Amouage', 'Anna Sui', 'Antonio Banderas', 'Arabian Oud',
-            'Ard al Zaafaran', 'Ariana Grande', 'Armand Basi', 'Atelier Cologne', 'Atkinsons',
-            'Attar Collection', 'Avon', 'Azzaro', 'BDK', 'Bharara', 'Boadicea The Victorius',
-            'Bond №9', 'Bottega Veneta', 'Brioni', 'Britney Spears', 'Burberry', 'Bvlgari',
-            'Byredo', 'Cacharel', 'Calvin Klein', 'Canali', 'Carolina Herrera', 'Caron',
-            'Cartier', 'Chanel', 'Chloe', 'Christian Dior', 'Clinique', 'Clive Christian',
-            'Creed', 'Cristiano Ronaldo', 'David Beckham', 'Davidoff', 'Dolce&Gabbana',
-            'Donna Karan', 'Dunhill', 'Elizabeth Arden', 'Escada', 'Escentric Molecules',
-            'Essential Parfums', 'Ex Nihilo', 'Fendi', 'Floraiku', 'Franck Boclet',
-            'Franck Olivier', 'Frederic Malle', 'Genyum', 'Giardini Di Toscana',
-            'Giorgio Armani', 'Gissah', 'Givaudan', 'Givenchy', 'Gucci', 'Guerlain',
-            'Hamidi', 'Haute Fragrance', 'Hermes', 'Hugo Boss', 'Ibraheem AlQurashi',
-            'Initio Parfums', 'IXORA', 'Jacques Bogart', 'Jean Paul Gaultier',
-            'Jimmy Choo', 'Jo Malone', 'Johan B.', 'Juliette Has A Gun', 'Junaid Perfumes',
-            'Kajal', 'Kayali Fragrances', 'Kenzo', 'Khalis', 'Khaltat', 'Kilian',
-            'Lacoste', 'Lalique', 'Lancome', 'Lanvin', 'Le Labo', 'Louis Vuitton',
-            'Maison Crivelli', 'Maison Francis Kurkdjian', 'Mancera', 'Marc-Antoine Barrois',
-            'Matiere Premiere', 'Memo', 'Molton Brown', 'Montale', 'Montblanc',
-            'Moschino', 'Narciso Rodriguez', 'Nasomatto', 'Nicolai Parfumeur Createur',
-            'Nina Ricci', 'Nishane', 'Ormonde Jayne', 'Orto Parisi', 'Paco Rabanne',
-            'Parfums De Marly', 'Paris World Luxury', 'Penhaligon\'s', 'Perfumer\'s Workshop',
-            'Prada', 'Rasasi', 'Reef Perfumes', 'Reiha', 'Renegades', 'Richard',
-            'Roja Dove', 'Rosendo Mateu', 'Rubeus Milano', 'Saab', 'Salvatore Ferragamo',
-            'Serge Lutens', 'Shaik', 'Surrati Perfumes', 'Swiss Arabian', 'Tauer Perfumes',
-            'Thameen', 'The House of Oud', 'Thomas Kosmala', 'Tiziana terenzi', 'Tom Ford',
-            'Trussardi', 'Van Cleef & Arpels', 'Versace', 'Vertus', 'Victoria Secret',
-            'Victoria\'s Secret', 'Viktor&Rolf', 'Vilhelm Parfumerie', 'Widian', 'Xerjoff',
-            'Yves Saint Laurent', 'Zadig & Voltaire', 'Zahra Perfumes', 'Zarkoperfume'
-        ]
 
-    def get_page_content(self, url: str) -> Optional[BeautifulSoup]:
-        """Получает содержимое страницы с правильной обработкой кодировки"""
+    def fetch_page(self, url: str) -> Optional[Tuple[bytes, Optional[str]]]:
+        """Загружает страницу: сырые байты и кодировка из заголовков (None - определит парсер)"""
         try:
-            response = self.session.get(url, timeout=30, stream=True)
-            response.raise_for_status()
-            
-            # Получаем сырой контент
-            content = response.content
-            
-            # Декодируем с учетом кодировки
-            if response.encoding:
-                text = content.decode(response.encoding)
-            else:
-                text = content.decode('utf-8', errors='ignore')
-            
-            return BeautifulSoup(text, 'html.parser')
-            
+            # with - соединение освобождается и при ошибочном HTTP-статусе
+            with self.session.get(url, timeout=30, stream=True) as response:
+                response.raise_for_status()
+                return response.content, _declared_encoding(response)
         except Exception as e:
             logger.error(f"Ошибка при загрузке {url}: {e}")
             return None
 
+    def get_page_content(self, url: str, parse_only: Optional[SoupStrainer] = None) -> Optional[BeautifulSoup]:
+        """Получает содержимое страницы с правильной обработкой кодировки
+        
+        parse_only ограничивает дерево нужными элементами - без построения узлов для всей страницы.
+        """
+        page = self.fetch_page(url)
+        if page is None:
+            return None
+        content, encoding = page
+        
+        try:
+            # Парсер lxml (libxml2) - в разы быстрее встроенного html.parser.
+            # Сырые байты отдаем вместе с кодировкой из заголовков - без промежуточной Python-строки
+            return BeautifulSoup(content, 'lxml', from_encoding=encoding, parse_only=parse_only)
+        except Exception as e:
+            logger.error(f"Ошибка при разборе {url}: {e}")
+            return None
+
+    def page_has_products(self, url: str) -> bool:
+        """Проверяет наличие товаров на странице, читая ее потоком до первой ссылки на товар"""
+        with self.session.get(url, timeout=30, stream=True) as response:
+            response.raise_for_status()
+            
+            # Инкрементальный парсер lxml получает байты по мере загрузки; как только встретилась
+            # ссылка product-title, соединение закрывается без дочитывания и разбора остатка страницы
+            try:
+                parser = etree.HTMLPullParser(events=('start',), tag='a', encoding=_declared_encoding(response))
+            except LookupError:
+                # Кодировка из заголовков неизвестна lxml - пусть определит сам, ссылку найдем и так
+                parser = etree.HTMLPullParser(events=('start',), tag='a')
+            
+            for chunk in response.iter_content(chunk_size=65536):
+                parser.feed(chunk)
+                if any(_is_product_link(element) for _, element in parser.read_events()):
+                    return True
+        
+        try:
+            parser.close()
+        except etree.XMLSyntaxError:
+            return False  # Пустая страница
+        return any(_is_product_link(element) for _, element in parser.read_events())
+
     def extract_factory_info(self, title: str) -> Tuple[str, str, str]:
         """
         Извлекает информацию о фабрике из названия товара
         Возвращает: (оригинальное_название, фабрика, артикул)
         """
-        factory = ""
-        article = ""
-        clean_title = title
-        
-        # Паттерны для поиска фабрик и артикулов
-        patterns = [
-            # Givaudan Premium/SuperLux
-            r',\s*(Givaudan Premium|Givaudan SuperLux)\s*$',
-            # SELUZ
-            r',\s*(SELUZ|Seluz)\s*$',
-            # Argeville
-            r',\s*(Argeville)\s*$',
-            # Lz с артикулом
-            r',\s*(Lz)\s+(\d+[\d\-T]*)\s*$',
-            r',\s*(Lz)\s+(\d+[\d\-/\s]*)\s*$',
-            # Просто Lz
-            r',\s*(Lz)\s*$',
-            # Другие фабрики
-            r',\s*(Bin Tammam|EPS|Hamidi|Iberchem|LZ AG|MG Gulcicek|Reiha|LUZI|Luzi)\s*([^,]*?)\s*$'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, title, re.IGNORECASE)
-            if match:
-                factory = match.group(1)
-                if len(match.groups()) > 1 and match.group(2):
-                    article = match.group(2).strip()
-                # Удаляем найденную фабрику из названия
-                clean_title = re.sub(pattern, '', title, flags=re.IGNORECASE).strip()
-                break
-        
-        return clean_title, factory, article
+        return _extract_factory_info(title)
 
     def parse_title_and_brand(self, title: str) -> Tuple[str, str, str, str]:
         """
         Парсит название, извлекая бренд, название аромата, фабрику и артикул
         Возвращает: (бренд, название_аромата, фабрика, артикул)
         """
-        # Сначала извлекаем информацию о фабрике
-        clean_title, factory, article = self.extract_factory_info(title)
-        
-        # Убираем "(мотив)" и подобные пометки
-        clean_title = re.sub(r'\s*\(мотив[^)]*\)\s*', ' ', clean_title).strip()
-        clean_title = re.sub(r'\s+', ' ', clean_title)  # Убираем лишние пробелы
-        
-        brand = ""
-        perfume_name = clean_title
-        
-        # Ищем известные бренды в начале названия
-        for known_brand in sorted(self.known_brands, key=len, reverse=True):
-            pattern = rf'^{re.escape(known_brand)}\s+'
-            if re.match(pattern, clean_title, re.IGNORECASE):
-                brand = known_brand
-                perfume_name = re.sub(pattern, '', clean_title, flags=re.IGNORECASE).strip()
-                break
-        
-        # Если бренд не найден, пробуем другие паттерны
-        if not brand:
-            # Паттерн: "Бренд - Название"
-            dash_match = re.match(r'^([^-]+?)\s*-\s*(.+)$', clean_title)
-            if dash_match:
-                potential_brand = dash_match.group(1).strip()
-                if len(potential_brand.split()) <= 3:  # Бренд обычно не более 3 слов
-                    brand = potential_brand
-                    perfume_name = dash_match.group(2).strip()
-            
-            # Паттерн: первые 1-2 слова как бренд
-            if not brand:
-                words = clean_title.split()
-                if len(words) >= 2:
-                    # Пробуем первые 2 слова
-                    potential_brand = ' '.join(words[:2])
-                    if any(char.isupper() for char in potential_brand):
-                        brand = potential_brand
-                        perfume_name = ' '.join(words[2:]) if len(words) > 2 else words[-1]
-                    else:
-                        # Пробуем первое слово
-                        brand = words[0]
-                        perfume_name = ' '.join(words[1:])
-        
-        return brand, perfume_name, factory, article
+        return _parse_title_and_brand(title)
 
     def extract_product_details(self, product_url: str) -> Dict[str, str]:
         """
@@ -202,7 +418,8 @@ class CompleteParfumeParser:
             'factory_detailed': ''
         }
         
-        soup = self.get_page_content(product_url)
+        # Из страницы товара нужен только блок характеристик
+        soup = self.get_page_content(product_url, parse_only=_FEATURES_BLOCK_ONLY)
         if not soup:
             return details
         
@@ -223,6 +440,11 @@ class CompleteParfumeParser:
                 
             label = label_elem.get_text(strip=True).lower()
             
+            # Сопоставляем характеристику - неизвестные пропускаем до поиска значения
+            field = next((field for needle, field in _FEATURE_LABELS if needle in label), None)
+            if field is None:
+                continue
+            
             # Ищем все span элементы в этом элементе
             all_spans = element.find_all('span')
             value = ""
@@ -238,19 +460,8 @@ class CompleteParfumeParser:
                         value = span.get_text(strip=True)
                     break
             
-            # Сопоставляем характеристики
-            if 'артикул' in label:
-                details['article'] = value
-            elif 'качество' in label:
-                details['quality'] = value
-            elif 'бренд' in label:
-                details['brand_detailed'] = value
-            elif 'пол' in label:
-                details['gender'] = value
-            elif 'группа аромата' in label:
-                details['fragrance_group'] = value
-            elif 'фабрика' in label:
-                details['factory_detailed'] = value
+            # Значения характеристик (пол, качество, группа) повторяются - интернируем
+            details[field] = sys.intern(value)
         
         return details
 
@@ -258,75 +469,31 @@ class CompleteParfumeParser:
         """
         Создает уникальный ключ для товара с учетом фабрики
         """
-        # Нормализуем данные
-        brand_norm = brand.lower().strip()
-        name_norm = name.lower().strip()
-        factory_norm = factory.lower().strip()
-        
-        # Ключ включает бренд, название и фабрику
-        return f"{brand_norm}|{name_norm}|{factory_norm}"
+        return _create_unique_key(brand, name, factory, article)
 
     def parse_catalog_page(self, url: str) -> List[Dict[str, str]]:
         """Парсит одну страницу каталога"""
-        soup = self.get_page_content(url)
-        if not soup:
+        page = self.fetch_page(url)
+        if page is None:
             return []
+        content, encoding = page
         
-        perfumes = []
-        product_links = soup.find_all('a', class_='product-title')
-        logger.info(f"Найдено товаров на странице {url}: {len(product_links)}")
-        
-        for link in product_links:
+        # Разбор HTML (CPU) уходит в пул процессов - поток тем временем ждет без GIL
+        if self._parse_pool is not None:
             try:
-                # Извлекаем название
-                title = link.get_text(strip=True)
-                if not title:
-                    continue
-                
-                # Парсим название
-                brand, perfume_name, factory, article = self.parse_title_and_brand(title)
-                
-                # URL товара
-                product_url = link.get('href')
-                if product_url:
-                    if product_url.startswith('/'):
-                        product_url = urljoin(self.base_url, product_url)
-                
-                # Ищем цену
-                price = ""
-                price_element = None
-                
-                # Ищем цену в родительских элементах
-                current = link
-                for _ in range(5):  # Максимум 5 уровней вверх
-                    current = current.parent
-                    if not current:
-                        break
-                    
-                    price_element = current.find(class_=re.compile(r'price'))
-                    if price_element:
-                        price = price_element.get_text(strip=True)
-                        break
-                
-                perfume_info = {
-                    'full_title': title,
-                    'brand': brand,
-                    'name': perfume_name,
-                    'factory': factory,
-                    'article': article,
-                    'url': product_url,
-                    'price': price,
-                    'unique_key': self.create_unique_key(brand, perfume_name, factory, article),
-                    # Подробные характеристики будут добавлены позже
-                    'details': {}
-                }
-                
-                perfumes.append(perfume_info)
-                
+                perfumes = self._parse_pool.submit(_parse_catalog_html, content, encoding, self.base_url).result()
             except Exception as e:
-                logger.error(f"Ошибка при обработке товара: {e}")
-                continue
+                logger.error(f"Ошибка пула разбора для {url}: {e}, разбираем в текущем потоке")
+                perfumes = _parse_catalog_html(content, encoding, self.base_url)
+        else:
+            perfumes = _parse_catalog_html(content, encoding, self.base_url)
         
+        # После pickle строки брендов и фабрик - новые объекты, интернируем повторно
+        for perfume in perfumes:
+            perfume['brand'] = sys.intern(perfume['brand'])
+            perfume['factory'] = sys.intern(perfume['factory'])
+        
+        logger.info(f"Найдено товаров на странице {url}: {len(perfumes)}")
         return perfumes
 
     def process_product_details(self, perfume: Dict[str, str]) -> Dict[str, str]:
@@ -364,7 +531,7 @@ class CompleteParfumeParser:
                 page_attr = link.get('data-ca-page', '')
                 
                 # Извлекаем номер страницы из href
-                page_match = re.search(r'/perfume/page-(\d+)/', href)
+                page_match = _PAGINATION_PAGE_RE.search(href)
                 if page_match:
                     page_num = int(page_match.group(1))
                     max_page_from_pagination = max(max_page_from_pagination, page_num)
@@ -381,31 +548,35 @@ class CompleteParfumeParser:
             """Проверяет есть ли товары на странице"""
             try:
                 test_url = f"{self.base_url}/perfume/page-{page_num}/"
-                test_soup = self.get_page_content(test_url)
-                if test_soup:
-                    products = test_soup.find_all('a', class_='product-title')
-                    return len(products) > 0
-                return False
+                return self.page_has_products(test_url)
             except Exception as e:
                 logger.error(f"Ошибка при проверке страницы {page_num}: {e}")
                 return False
         
-        # Бинарный поиск максимальной страницы
+        # K-арный поиск максимальной страницы: за раунд параллельно проверяем k точек,
+        # диапазон сужается в k+1 раз вместо 2
         low = 1
         high = max(max_page_from_pagination * 2, 50)  # Берем в 2 раза больше найденного или минимум 50
         last_valid_page = 1
+        probes_per_round = max(2, self.max_workers)
         
         logger.info(f"Ищу максимальную страницу в диапазоне 1-{high}...")
         
-        while low <= high:
-            mid = (low + high) // 2
-            logger.debug(f"Проверяю страницу {mid}")
-            
-            if has_products(mid):
-                last_valid_page = mid
-                low = mid + 1
-            else:
-                high = mid - 1
+        with concurrent.futures.ThreadPoolExecutor(max_workers=probes_per_round) as executor:
+            while low <= high:
+                probes = sorted({low + (high - low) * (i + 1) // (probes_per_round + 1)
+                                 for i in range(probes_per_round)})
+                logger.debug(f"Проверяю страницы {probes}")
+                
+                # Страницы с товарами идут сплошным префиксом: до первой пустой сдвигаем low,
+                # на первой пустой сужаем high
+                for page_num, found in zip(probes, executor.map(has_products, probes)):
+                    if found:
+                        last_valid_page = page_num
+                        low = page_num + 1
+                    else:
+                        high = page_num - 1
+                        break
         
         logger.info(f"Найдена максимальная страница: {last_valid_page}")
         
@@ -422,109 +593,113 @@ class CompleteParfumeParser:
     def parse_all_catalog(self) -> List[Dict[str, str]]:
         """Парсит весь каталог"""
         all_urls = self.get_all_pages_urls()
+        if not self.parse_in_processes:
+            return self._collect_catalog(all_urls)
+        
+        # Разбор HTML страниц каталога - в отдельных процессах. Только для запуска скриптом:
+        # spawn-воркер заново импортирует __main__, внутри бота это был бы весь main.py
+        parse_workers = min(self.max_workers, os.cpu_count() or 1)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=parse_workers,
+                                                    mp_context=multiprocessing.get_context('spawn')) as parse_pool:
+            self._parse_pool = parse_pool
+            try:
+                return self._collect_catalog(all_urls)
+            finally:
+                self._parse_pool = None
+
+    def _collect_catalog(self, all_urls: List[str]) -> List[Dict[str, str]]:
+        """Собирает товары со страниц каталога и их подробные характеристики"""
         all_perfumes = []
         unique_keys = set()
+        seen_urls = set()
         
-        # Этап 1: Сбор базовой информации со всех страниц каталога
+        # Этапы 1 и 2 идут конвейером: детали товара запрашиваются сразу после разбора
+        # его страницы каталога, не дожидаясь обхода всех страниц
         logger.info("🔍 Этап 1: Сбор базовой информации со страниц каталога...")
-        for i, url in enumerate(all_urls, 1):
-            logger.info(f"Обрабатываю страницу каталога {i}/{len(all_urls)}: {url}")
-            
-            page_perfumes = self.parse_catalog_page(url)
+        logger.info("🔍 Этап 2: Извлечение подробных характеристик товаров (по мере поступления страниц)...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as page_executor, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as details_executor:
+            # Страницы загружаются параллельно, но map отдает их по порядку -
+            # дедупликация дает тот же результат, что и последовательный обход
+            pages = page_executor.map(self.parse_catalog_page, all_urls)
+            detail_futures = []
             
-            # Добавляем только уникальные товары (с учетом фабрики)
-            for perfume in page_perfumes:
-                unique_key = perfume['unique_key']
-                if unique_key not in unique_keys:
-                    unique_keys.add(unique_key)
-                    all_perfumes.append(perfume)
-                else:
-                    logger.debug(f"Пропущен дубликат: {perfume['full_title']}")
+            for i, (url, page_perfumes) in enumerate(zip(all_urls, pages), 1):
+                logger.info(f"Обработана страница каталога {i}/{len(all_urls)}: {url}")
+                
+                # Добавляем только уникальные товары (с учетом фабрики и ссылки на товар)
+                for perfume in page_perfumes:
+                    unique_key = perfume['unique_key']
+                    product_url = perfume.get('url')
+                    if unique_key not in unique_keys and (not product_url or product_url not in seen_urls):
+                        unique_keys.add(unique_key)
+                        if product_url:
+                            seen_urls.add(product_url)
+                        all_perfumes.append(perfume)
+                        detail_futures.append(details_executor.submit(self.process_product_details, perfume))
+                    else:
+                        logger.debug(f"Пропущен дубликат: {perfume['full_title']}")
             
-            # Задержка между запросами убрана для оптимизации производительности
-            # if i < len(all_urls):
-            #     time.sleep(1)
-        
-        logger.info(f"Найдено уникальных товаров: {len(all_perfumes)}")
-        
-        # Этап 2: Извлечение подробных характеристик с использованием многопоточности
-        logger.info("🔍 Этап 2: Извлечение подробных характеристик товаров...")
-        
-        # Для больших объемов данных можно ограничить количество товаров для извлечения деталей
-        # Например, только первые 100 товаров для быстрого тестирования
-        if len(all_perfumes) > 50000:
-            logger.info(f"⚠️ Найдено {len(all_perfumes)} товаров. Для демонстрации обрабатываю только первые 100 товаров с подробными характеристиками.")
-            test_perfumes = all_perfumes[:100]  # Первые 100 для демонстрации
-        else:
-            test_perfumes = all_perfumes  # Все товары если их не очень много
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Отправляем задачи на выполнение
-            future_to_perfume = {
-                executor.submit(self.process_product_details, perfume): perfume 
-                for perfume in test_perfumes
-            }
+            logger.info(f"Найдено уникальных товаров: {len(all_perfumes)}")
             
             # Собираем результаты
             completed_perfumes = []
-            for i, future in enumerate(concurrent.futures.as_completed(future_to_perfume), 1):
+            for i, future in enumerate(concurrent.futures.as_completed(detail_futures), 1):
                 try:
                     perfume = future.result()
                     completed_perfumes.append(perfume)
                     
                     if i % 10 == 0:  # Логируем каждые 10 товаров
-                        logger.info(f"Обработано товаров: {i}/{len(test_perfumes)}")
+                        logger.info(f"Обработано товаров: {i}/{len(detail_futures)}")
                         
                 except Exception as e:
                     logger.error(f"Ошибка при обработке товара: {e}")
-                
-                # Небольшая задержка между запросами убрана для оптимизации производительности
-                # time.sleep(0.5)
         
         logger.info(f"Всего обработано товаров с подробными характеристиками: {len(completed_perfumes)}")
         return completed_perfumes
 
     def analyze_data(self, perfumes: List[Dict[str, str]]) -> Dict:
         """Анализирует собранные данные"""
-        factory_stats = {}
-        brand_stats = {}
-        quality_stats = {}
-        gender_stats = {}
-        fragrance_group_stats = {}
+        factory_stats = Counter()
+        brand_stats = Counter()
+        quality_stats = Counter()
+        gender_stats = Counter()
+        fragrance_group_stats = Counter()
+        products_with_details = 0
         
         for perfume in perfumes:
+            details = perfume.get('details', {})
+            
             # Статистика по фабрикам
-            factory = perfume.get('details', {}).get('factory_detailed') or perfume.get('factory', 'Не указана')
-            factory_stats[factory] = factory_stats.get(factory, 0) + 1
+            factory_stats[details.get('factory_detailed') or perfume.get('factory', 'Не указана')] += 1
             
             # Статистика по брендам
-            brand = perfume.get('details', {}).get('brand_detailed') or perfume.get('brand', 'Неизвестный')
-            brand_stats[brand] = brand_stats.get(brand, 0) + 1
+            brand_stats[details.get('brand_detailed') or perfume.get('brand', 'Неизвестный')] += 1
             
             # Статистика по качеству
-            quality = perfume.get('details', {}).get('quality', 'Не указано')
-            quality_stats[quality] = quality_stats.get(quality, 0) + 1
+            quality_stats[details.get('quality', 'Не указано')] += 1
             
             # Статистика по полу
-            gender = perfume.get('details', {}).get('gender', 'Не указан')
-            gender_stats[gender] = gender_stats.get(gender, 0) + 1
+            gender_stats[details.get('gender', 'Не указан')] += 1
             
             # Статистика по группам ароматов
-            fragrance_group = perfume.get('details', {}).get('fragrance_group', 'Не указана')
+            fragrance_group = details.get('fragrance_group', 'Не указана')
             if fragrance_group and fragrance_group != 'Не указана':
                 # Разделяем группы ароматов по запятым
-                groups = [g.strip() for g in fragrance_group.split(',')]
-                for group in groups:
-                    fragrance_group_stats[group] = fragrance_group_stats.get(group, 0) + 1
+                fragrance_group_stats.update(g.strip() for g in fragrance_group.split(','))
+            
+            if details.get('article'):
+                products_with_details += 1
         
+        # most_common() - сортировка по убыванию с сохранением порядка при равенстве
         return {
-            'factory_stats': dict(sorted(factory_stats.items(), key=lambda x: x[1], reverse=True)),
-            'brand_stats': dict(sorted(brand_stats.items(), key=lambda x: x[1], reverse=True)),
-            'quality_stats': dict(sorted(quality_stats.items(), key=lambda x: x[1], reverse=True)),
-            'gender_stats': dict(sorted(gender_stats.items(), key=lambda x: x[1], reverse=True)),
-            'fragrance_group_stats': dict(sorted(fragrance_group_stats.items(), key=lambda x: x[1], reverse=True)),
+            'factory_stats': dict(factory_stats.most_common()),
+            'brand_stats': dict(brand_stats.most_common()),
+            'quality_stats': dict(quality_stats.most_common()),
+            'gender_stats': dict(gender_stats.most_common()),
+            'fragrance_group_stats': dict(fragrance_group_stats.most_common()),
             'total_products': len(perfumes),
-            'products_with_details': sum(1 for p in perfumes if p.get('details', {}).get('article'))
+            'products_with_details': products_with_details
         }
 
     def save_to_json(self, filename: str = 'complete_perfumes_catalog.json') -> None:
@@ -536,21 +711,27 @@ class CompleteParfumeParser:
         # Анализируем данные
         analysis = self.analyze_data(self.perfumes)
         
-        data = {
-            'metadata': {
-                'source': 'aroma-euro.ru',
-                'catalog_url': f'{self.base_url}/perfume/',
-                'parsing_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'total_count': len(self.perfumes),
-                'parser_version': 'complete-details-1.0',
-                'analysis': analysis
-            },
-            'perfumes': self.perfumes
+        metadata = {
+            'source': 'aroma-euro.ru',
+            'catalog_url': f'{self.base_url}/perfume/',
+            'parsing_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'total_count': len(self.perfumes),
+            'parser_version': 'complete-details-1.0',
+            'analysis': analysis
         }
         
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            # Тот же объект {"metadata": ..., "perfumes": [...]}, но массив пишется потоком:
+            # orjson кодирует по одной записи (строка на товар), без общего буфера на весь каталог
+            with open(filename, 'wb') as f:
+                f.write(b'{"metadata": ')
+                f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+                f.write(b',\n"perfumes": [\n')
+                for i, perfume in enumerate(self.perfumes):
+                    if i:
+                        f.write(b',\n')
+                    f.write(orjson.dumps(perfume, option=orjson.OPT_NON_STR_KEYS))
+                f.write(b'\n]}\n')
             logger.info(f"Данные сохранены в файл: {filename}")
             
             # Выводим статистику
@@ -560,17 +741,20 @@ class CompleteParfumeParser:
             logger.error(f"Ошибка при сохранении файла: {e}")
 
     def print_statistics(self, analysis: Dict) -> None:
-        """Выводит подробную статистику"""
+        """Выводит подробную статистику
+        
+        Статистика из analyze_data уже отсортирована по убыванию - топ берется срезом islice.
+        """
         print(f"\n📊 ПОДРОБНАЯ СТАТИСТИКА ПАРСИНГА:")
         print(f"Всего товаров: {analysis['total_products']}")
         print(f"Товаров с подробными характеристиками: {analysis['products_with_details']}")
         
         print(f"\n🏭 ТОП ФАБРИК:")
-        for factory, count in list(analysis['factory_stats'].items())[:10]:
+        for factory, count in islice(analysis['factory_stats'].items(), 10):
             print(f"  {factory}: {count} товаров")
         
         print(f"\n🏷️ ТОП БРЕНДОВ:")
-        for brand, count in list(analysis['brand_stats'].items())[:10]:
+        for brand, count in islice(analysis['brand_stats'].items(), 10):
             print(f"  {brand}: {count} товаров")
         
         print(f"\n⭐ КАЧЕСТВО ТОВАРОВ:")
@@ -582,11 +766,12 @@ class CompleteParfumeParser:
             print(f"  {gender}: {count} товаров")
         
         print(f"\n🌸 ТОП ГРУПП АРОМАТОВ:")
-        for group, count in list(analysis['fragrance_group_stats'].items())[:10]:
+        for group, count in islice(analysis['fragrance_group_stats'].items(), 10):
             print(f"  {group}: {count} товаров")
 
 def main():
-    parser = CompleteParfumeParser(max_workers=5)  # 3 потока для извлечения деталей
+    # Запуск скриптом - страницы каталога разбираются в отдельных процессах
+    parser = CompleteParfumeParser(max_workers=5, parse_in_processes=True)
     
     print("🚀 Запуск полноценного парсера с подробными характеристиками...")
     print("📍 Сайт: https://aroma-euro.ru/perfume/")
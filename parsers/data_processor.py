@@ -8,6 +8,41 @@ from hashlib import md5
 
 logger = logging.getLogger(__name__)
 
+# Правила нормализации: (подстроки в нижнем регистре, стандартное значение), проверяются по порядку
+_GENDER_RULES = (
+    (('мужск', 'men'), 'Мужской'),
+    (('женск', 'women'), 'Женский'),
+    (('унисекс', 'unisex'), 'Унисекс'),
+)
+
+_QUALITY_RULES = (
+    (('премиум', 'premium'), 'Премиум'),
+    (('люкс', 'lux'), 'Люкс'),
+    (('стандарт', 'standard'), 'Стандарт'),
+    (('эконом', 'econom'), 'Эконом'),
+)
+
+# Стандартные группы ароматов
+_FRAGRANCE_GROUP_RULES = (
+    (('цветочн',), 'Цветочные'),
+    (('цитрус',), 'Цитрусовые'),
+    (('древесн',), 'Древесные'),
+    (('свеж',), 'Свежие'),
+    (('восточн',), 'Восточные'),
+    (('гурман',), 'Гурманские'),
+    (('фужер',), 'Фужерные'),
+    (('шипр',), 'Шипровые'),
+    (('амбр',), 'Амбровые'),
+    (('мускус',), 'Мускусные'),
+)
+
+def _match_rule(text_lower: str, rules: tuple) -> Optional[str]:
+    """Возвращает значение первого правила, подстрока которого входит в текст"""
+    return next(
+        (value for needles, value in rules if any(needle in text_lower for needle in needles)),
+        None
+    )
+
 class DataProcessor:
     """Процессор для нормализации и обработки данных парфюмов"""
     
@@ -20,6 +55,8 @@ class DataProcessor:
             'Hamidi', 'Iberchem', 'LZ AG', 'Lz', 'LZ', 'MG Gulcicek', 'Reiha', 
             'Argeville', 'SELUZ', 'Seluz', 'LUZI', 'Luzi'
         ]
+        # Нижний регистр считается один раз, а не для каждой фабрики на каждый товар
+        self._known_factories_lower = [(factory.lower(), factory) for factory in self.known_factories]
         
         logger.info("🔧 DataProcessor инициализирован")
     
@@ -141,8 +178,9 @@ class DataProcessor:
         factory_clean = self._clean_text(factory)
         
         # Проверяем соответствие известным фабрикам
-        for known_factory in self.known_factories:
-            if known_factory.lower() in factory_clean.lower():
+        factory_lower = factory_clean.lower()
+        for known_lower, known_factory in self._known_factories_lower:
+            if known_lower in factory_lower:
                 return known_factory
         
         return factory_clean
@@ -191,62 +229,21 @@ class DataProcessor:
         if not gender:
             return ''
         
-        gender_lower = gender.lower()
-        
-        if 'мужск' in gender_lower or 'men' in gender_lower:
-            return 'Мужской'
-        elif 'женск' in gender_lower or 'women' in gender_lower:
-            return 'Женский'
-        elif 'унисекс' in gender_lower or 'unisex' in gender_lower:
-            return 'Унисекс'
-        
-        return self._clean_text(gender)
+        return _match_rule(gender.lower(), _GENDER_RULES) or self._clean_text(gender)
     
     def _normalize_fragrance_group(self, fragrance_group: str) -> str:
         """Нормализует группу ароматов"""
         if not fragrance_group:
             return ''
         
-        # Список стандартных групп ароматов
-        standard_groups = {
-            'цветочн': 'Цветочные',
-            'цитрус': 'Цитрусовые', 
-            'древесн': 'Древесные',
-            'свеж': 'Свежие',
-            'восточн': 'Восточные',
-            'гурман': 'Гурманские',
-            'фужер': 'Фужерные',
-            'шипр': 'Шипровые',
-            'амбр': 'Амбровые',
-            'мускус': 'Мускусные'
-        }
-        
-        fragrance_lower = fragrance_group.lower()
-        
-        for key, standard_name in standard_groups.items():
-            if key in fragrance_lower:
-                return standard_name
-        
-        return self._clean_text(fragrance_group)
+        return _match_rule(fragrance_group.lower(), _FRAGRANCE_GROUP_RULES) or self._clean_text(fragrance_group)
     
     def _normalize_quality_level(self, quality: str) -> str:
         """Нормализует уровень качества"""
         if not quality:
             return ''
         
-        quality_lower = quality.lower()
-        
-        # Стандартные уровни качества
-        if 'премиум' in quality_lower or 'premium' in quality_lower:
-            return 'Премиум'
-        elif 'люкс' in quality_lower or 'lux' in quality_lower:
-            return 'Люкс'
-        elif 'стандарт' in quality_lower or 'standard' in quality_lower:
-            return 'Стандарт'
-        elif 'эконом' in quality_lower or 'econom' in quality_lower:
-            return 'Эконом'
-        
-        return self._clean_text(quality)
+        return _match_rule(quality.lower(), _QUALITY_RULES) or self._clean_text(quality)
     
     def validate_perfume_data(self, perfume_data: Dict[str, Any]) -> bool:
         """Валидирует данные парфюма перед сохранением"""
@@ -1,27 +1,541 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import logging
 import asyncio
-import aiohttp
-import time
-from typing import Dict, List, Any, Optional
+import logging
+import sys
+from typing import Dict, List, Any, Optional, Final, ClassVar
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from datetime import datetime
-import json
 import re
-from utils.metrics import metrics_collector, track_function
+from array import array
+from functools import lru_cache
+from utils.metrics import track_function
+from ai.processor import RateLimitError
 
 logger = logging.getLogger(__name__)
 
+# Код "нет ответа" в компактном векторе ответов (uint16)
+_MISSING_ANSWER_CODE: Final = 0xFFFF
+# Максимум опций в вопросе: битовая маска из 15 бит не достигает кода "нет ответа"
+_MAX_ENCODED_OPTIONS: Final = 15
+
+# Подписи блоков вопросов
+BLOCK_LABELS: Final[Dict[str, str]] = {
+    'demographic': '1️⃣ Демографический блок',
+    'psychological': '2️⃣ Психологический блок',
+    'lifestyle': '3️⃣ Lifestyle блок',
+    'sensory': '4️⃣ Сенсорный блок (Edwards Wheel)',
+    'emotional': '5️⃣ Эмоционально-ассоциативный блок'
+}
+
+# Названия семейств Edwards Fragrance Wheel
+FAMILY_NAMES: Final[Dict[str, str]] = {
+    'floral': 'Цветочные',
+    'oriental': 'Восточные/Амбровые',
+    'woody': 'Древесные',
+    'fresh': 'Свежие'
+}
+
+# Ключевые слова семейств Edwards Fragrance Wheel
+_EDWARDS_KEYWORDS: Final[Dict[str, tuple]] = {
+    'floral': ('floral', 'rose', 'jasmine', 'peony', 'lily', 'romantic', 'feminine', 'gentle', 'нежный', 'романтичный', 'чувственный', 'женственный'),
+    'oriental': ('oriental', 'amber', 'vanilla', 'musk', 'warm', 'spicy', 'exotic', 'intense', 'теплый', 'пряный', 'восточный', 'насыщенный', 'согревающий'),
+    'woody': ('woody', 'sandalwood', 'cedar', 'forest', 'pine', 'earthy', 'masculine', 'древесный', 'лесной', 'мужской', 'строгий'),
+    'fresh': ('fresh', 'citrus', 'green', 'aquatic', 'marine', 'clean', 'light', 'свежий', 'легкий', 'морской', 'чистый', 'прохладный', 'дневной', 'летний', 'весенний')
+}
+
+# Обратный индекс: ключевое слово в нижнем регистре -> семейства (строится один раз)
+_KEYWORD_FAMILIES: Final[Dict[str, tuple]] = {}
+for _family, _keywords in _EDWARDS_KEYWORDS.items():
+    for _keyword in _keywords:
+        _keyword = _keyword.lower()
+        _KEYWORD_FAMILIES[_keyword] = _KEYWORD_FAMILIES.get(_keyword, ()) + (_family,)
+del _family, _keywords, _keyword
+
+# 15 научно обоснованных вопросов квиза - неизменная структура, строится один раз при импорте
+_QUIZ_QUESTIONS: Final[tuple] = (
+    # БЛОК 1: ДЕМОГРАФИЧЕСКИЙ (2 вопроса)
+    {
+        "id": "gender",
+        "block": "demographic",
+        "question": "👤 **Для кого предназначен аромат?**",
+        "type": "single_choice",
+        "options": (
+            {
+                "text": "👩 Для меня (женщина)",
+                "value": "female",
+                "keywords": ("женский", "feminine", "floral", "delicate")
+            },
+            {
+                "text": "👨 Для меня (мужчина)",
+                "value": "male",
+                "keywords": ("мужской", "masculine", "woody", "strong")
+            },
+            {
+                "text": "🌈 Унисекс",
+                "value": "unisex",
+                "keywords": ("унисекс", "unisex", "neutral", "balanced")
+            }
+        )
+    },
+    {
+        "id": "age_experience",
+        "block": "demographic",
+        "question": "🎓 **Ваш опыт с парфюмерией?**",
+        "type": "single_choice",
+        "options": (
+            {
+                "text": "🌱 Новичок (первые ароматы)",
+                "value": "beginner",
+                "keywords": ("легкий", "простой", "классический", "популярный", "безопасный")
+            },
+            {
+                "text": "🌿 Имею базовый опыт",
+                "value": "intermediate",
+                "keywords": ("современный", "трендовый", "качественный", "сбалансированный")
+            },
+            {
+                "text": "🌳 Продвинутый (коллекционер)",
+                "value": "advanced",
+                "keywords": ("нишевый", "эксклюзивный", "сложный", "уникальный", "артистический")
+            }
+        )
+    },
+
+    # БЛОК 2: ПСИХОЛОГИЧЕСКИЙ (3 вопроса)
+    {
+        "id": "personality_type",
+        "block": "psychological",
+        "question": "🧠 **Какой тип личности вам ближе?**",
+        "type": "single_choice",
+        "options": (
+            {
+                "text": "💕 Романтик",
+                "value": "romantic",
+                "keywords": ("романтичный", "чувственный", "нежный", "floral", "rose", "jasmine")
+            },
+            {
+                "text": "🎓 Интеллектуал",
+                "value": "intellectual",
+                "keywords": ("сложный", "утонченный", "изысканный", "green", "herbaceous")
+            },
+            {
+                "text": "🎉 Экстраверт",
+                "value": "extrovert",
+                "keywords": ("яркий", "заметный", "bold", "oriental", "spicy")
+            },
+            {
+                "text": "🤫 Интроверт",
+                "value": "introvert",
+                "keywords": ("спокойный", "деликатный", "subtle", "woody", "musky")
+            },
+            {
+                "text": "🔬 Логик-аналитик",
+                "value": "analytical",
+                "keywords": ("структурированный", "чистый", "minimalistic", "aquatic", "ozonic")
+            }
+        )
+    },
+    {
+        "id": "lifestyle",
+        "block": "psychological", 
+        "question": "🏃 **Опишите ваш образ жизни:**",
+        "type": "single_choice",
+        "options": (
+            {
+                "text": "⚡ Активный и динамичный",
+                "value": "active",
+                "keywords": ("энергичный", "спортивный", "fresh", "citrus", "energizing")
+            },
+            {
+                "text": "🧘 Спокойный и размеренный",
+                "value": "calm",
+                "keywords": ("расслабляющий", "мягкий", "comforting", "vanilla", "amber")
+            },
+            {
+                "text": "🎨 Творческий и артистичный",
+                "value": "creative",
+                "keywords": ("креативный", "необычный", "artistic", "incense", "patchouli")
+            },
+            {
+                "text": "💼 Деловой и профессиональный",
+                "value": "professional",
+                "keywords": ("строгий", "элегантный", "sophisticated", "cedar", "sandalwood")
+            }
+        )
+    },
+    {
+        "id": "usage_time",
+        "block": "psychological",
+        "question": "⏰ **В какое время дня планируете использовать аромат?**",
+        "type": "multiple_choice",
+        "options": (
+            {
+                "text": "🌅 Утром и днем",
+                "value": "day",
+                "keywords": ("дневной", "light", "fresh", "citrus", "green")
+            },
+            {
+                "text": "🌃 Вечером",
+                "value": "evening",
+                "keywords": ("вечерний", "intense", "oriental", "woody", "amber")
+            },
+            {
+                "text": "✨ На особые случаи",
+                "value": "special",
+                "keywords": ("праздничный", "luxurious", "sophisticated", "oud", "rare")
+            },
+            {
+                "text": "🔄 Универсально",
+                "value": "universal",
+                "keywords": ("универсальный", "versatile", "balanced", "moderate")
+            }
+        )
+    },
+
+    # БЛОК 3: LIFESTYLE (4 вопроса)
+    {
+        "id": "occasions",
+        "block": "lifestyle",
+        "question": "🎭 **Для каких случаев нужен аромат?**",
+        "type": "multiple_choice",
+        "options": (
+            {
+                "text": "🏢 Повседневная работа/учеба",
+                "value": "work",
+                "keywords": ("офисный", "деликатный", "professional", "clean", "subtle")
+            },
+            {
+                "text": "💕 Романтические встречи",
+                "value": "romantic",
+                "keywords": ("соблазнительный", "чувственный", "seductive", "rose", "ylang-ylang")
+            },
+            {
+                "text": "🎉 Вечеринки и мероприятия",
+                "value": "party",
+                "keywords": ("яркий", "запоминающийся", "party", "gourmand", "sweet")
+            },
+            {
+                "text": "🏃 Спорт и активность",
+                "value": "sport",
+                "keywords": ("свежий", "легкий", "sport", "aquatic", "marine")
+            },
+            {
+                "text": "🛋️ Отдых и релакс",
+                "value": "relaxation",
+                "keywords": ("успокаивающий", "комфортный", "relaxing", "lavender", "chamomile")
+            }
+        )
+    },
+    {
+        "id": "style_preference",
+        "block": "lifestyle",
+        "question": "👔 **Ваш стиль в одежде:**",
+        "type": "single_choice",
+        "options": (
+            {
+                "text": "👑 Классический и элегантный",
+                "value": "classic",
+                "keywords": ("классический", "элегантный", "timeless", "chypre", "aldehydic")
+            },
+            {
+                "text": "🔥 Модный и трендовый",
+                "value": "trendy",
+                "keywords": ("модный", "современный", "trendy", "fruity", "synthetic")
+            },
+            {
+                "text": "👕 Casual и комфортный",
+                "value": "casual",
+                "keywords": ("простой", "комфортный", "easy-going", "cotton", "clean")
+            },
+            {
+                "text": "⚡ Экстравагантный и яркий",
+                "value": "bold",
+                "keywords": ("яркий", "смелый", "extravagant", "leather", "tobacco")
+            }
+        )
+    },
+    {
+        "id": "budget_category",
+        "block": "lifestyle",
+        "question": "💰 **Предпочтительная ценовая категория:**",
+        "type": "single_choice",
+        "options": (
+            {
+                "text": "💸 Доступная (масс-маркет)",
+                "value": "mass_market",
+                "keywords": ("популярный", "доступный", "commercial", "mainstream")
+            },
+            {
+                "text": "💎 Средняя (селективная)",
+                "value": "selective",
+                "keywords": ("качественный", "селективный", "premium", "boutique")
+            },
+            {
+                "text": "👑 Высокая (люкс/нишевая)",
+                "value": "luxury",
+                "keywords": ("люксовый", "нишевый", "luxury", "exclusive", "artisanal")
+            }
+        )
+    },
+    {
+        "id": "longevity_preference",
+        "block": "lifestyle",
+        "question": "⏱️ **Предпочтительная стойкость аромата:**",
+        "type": "single_choice",
+        "options": (
+            {
+                "text": "🌸 Легкий и ненавязчивый (2-4 часа)",
+                "value": "light",
+                "keywords": ("легкий", "деликатный", "eau_de_cologne", "citrus", "aromatic")
+            },
+            {
+                "text": "⚖️ Умеренной стойкости (4-6 часов)",
+                "value": "moderate",
+                "keywords": ("умеренный", "сбалансированный", "eau_de_toilette", "balanced")
+            },
+            {
+                "text": "💪 Стойкий и насыщенный (8+ часов)",
+                "value": "long_lasting",
+                "keywords": ("стойкий", "насыщенный", "eau_de_parfum", "intense", "heavy")
+            }
+        )
+    },
+
+    # БЛОК 4: СЕНСОРНЫЙ (3 вопроса) - Edwards Fragrance Wheel
+    {
+        "id": "fragrance_families",
+        "block": "sensory",
+        "question": "🌸 **Какие ароматические семейства вам нравятся? (Edwards Wheel)**",
+        "type": "multiple_choice",
+        "options": (
+            {
+                "text": "🌸 Цветочные (роза, жасмин, пион)",
+                "value": "floral",
+                "keywords": ("floral", "rose", "jasmine", "peony", "lily", "romantic")
+            },
+            {
+                "text": "🌟 Восточные/Амбровые (ваниль, амбра, мускус)",
+                "value": "oriental",
+                "keywords": ("oriental", "amber", "vanilla", "musk", "resin", "warm")
+            },
+            {
+                "text": "🌳 Древесные (сандал, кедр, дуб)",
+                "value": "woody",
+                "keywords": ("woody", "sandalwood", "cedar", "oak", "pine", "forest")
+            },
+            {
+                "text": "💧 Свежие (цитрус, зеленые, водные)",
+                "value": "fresh",
+                "keywords": ("fresh", "citrus", "green", "aquatic", "marine", "clean")
+            }
+        )
+    },
+    {
+        "id": "intensity_preference",
+        "block": "sensory",
+        "question": "📶 **Предпочтительная интенсивность аромата:**",
+        "type": "single_choice",
+        "options": (
+            {
+                "text": "🌸 Деликатная и тонкая",
+                "value": "delicate",
+                "keywords": ("деликатный", "тонкий", "subtle", "soft", "gentle")
+            },
+            {
+                "text": "⚖️ Умеренная и сбалансированная",
+                "value": "moderate",
+                "keywords": ("умеренный", "сбалансированный", "moderate", "balanced")
+            },
+            {
+                "text": "🔥 Яркая и насыщенная",
+                "value": "intense",
+                "keywords": ("яркий", "насыщенный", "intense", "bold", "powerful")
+            }
+        )
+    },
+    {
+        "id": "seasonal_preference",
+        "block": "sensory",
+        "question": "🌍 **В какие сезоны планируете носить аромат?**",
+        "type": "multiple_choice",
+        "options": (
+            {
+                "text": "🌸 Весна",
+                "value": "spring",
+                "keywords": ("весенний", "свежий", "green", "floral", "light")
+            },
+            {
+                "text": "☀️ Лето",
+                "value": "summer",
+                "keywords": ("летний", "легкий", "citrus", "aquatic", "fresh")
+            },
+            {
+                "text": "🍂 Осень",
+                "value": "autumn",
+                "keywords": ("осенний", "теплый", "spicy", "woody", "amber")
+            },
+            {
+                "text": "❄️ Зима",
+                "value": "winter",
+                "keywords": ("зимний", "согревающий", "oriental", "heavy", "intense")
+            }
+        )
+    },
+
+    # БЛОК 5: ЭМОЦИОНАЛЬНО-АССОЦИАТИВНЫЙ (3 вопроса)
+    {
+        "id": "desired_mood",
+        "block": "emotional",
+        "question": "😊 **Какие настроения и эмоции хотите передать?**",
+        "type": "multiple_choice",
+        "options": (
+            {
+                "text": "💪 Уверенность и силу",
+                "value": "confidence",
+                "keywords": ("уверенный", "сильный", "powerful", "dominant", "leader")
+            },
+            {
+                "text": "💕 Романтику и нежность",
+                "value": "romance",
+                "keywords": ("романтичный", "нежный", "romantic", "tender", "loving")
+            },
+            {
+                "text": "👑 Элегантность и изысканность",
+                "value": "elegance",
+                "keywords": ("элегантный", "изысканный", "sophisticated", "refined", "classy")
+            },
+            {
+                "text": "⚡ Энергию и жизнерадостность",
+                "value": "energy",
+                "keywords": ("энергичный", "жизнерадостный", "energetic", "vibrant", "happy")
+            },
+            {
+                "text": "🧘 Спокойствие и гармонию",
+                "value": "calm",
+                "keywords": ("спокойный", "гармоничный", "peaceful", "serene", "balanced")
+            }
+        )
+    },
+    {
+        "id": "scent_memories",
+        "block": "emotional",
+        "question": "🌺 **Какие ароматические воспоминания вам приятны?**",
+        "type": "multiple_choice",
+        "options": (
+            {
+                "text": "🌷 Цветущий сад весной",
+                "value": "garden",
+                "keywords": ("цветочный", "природный", "garden", "blooming", "natural")
+            },
+            {
+                "text": "🏠 Уютный дом с выпечкой",
+                "value": "home_comfort",
+                "keywords": ("уютный", "сладкий", "gourmand", "vanilla", "caramel")
+            },
+            {
+                "text": "🌲 Прогулка по лесу",
+                "value": "forest",
+                "keywords": ("лесной", "древесный", "forest", "pine", "earthy")
+            },
+            {
+                "text": "🌊 Морской берег",
+                "value": "ocean",
+                "keywords": ("морской", "свежий", "marine", "salty", "breeze")
+            },
+            {
+                "text": "🕌 Восточный базар",
+                "value": "oriental_market",
+                "keywords": ("восточный", "пряный", "spicy", "exotic", "incense")
+            }
+        )
+    },
+    {
+        "id": "color_associations",
+        "block": "emotional",
+        "question": "🎨 **Какие цвета ассоциируются с вашим идеальным ароматом?**",
+        "type": "multiple_choice",
+        "options": (
+            {
+                "text": "⚪ Белый и светлые оттенки",
+                "value": "white_light",
+                "keywords": ("чистый", "невинный", "clean", "pure", "innocent")
+            },
+            {
+                "text": "🌸 Розовый и персиковый",
+                "value": "pink_peach",
+                "keywords": ("нежный", "женственный", "gentle", "feminine", "soft")
+            },
+            {
+                "text": "🟡 Золотой и янтарный",
+                "value": "gold_amber",
+                "keywords": ("теплый", "роскошный", "warm", "luxurious", "rich")
+            },
+            {
+                "text": "🟢 Зеленый и природные тона",
+                "value": "green_natural",
+                "keywords": ("природный", "свежий", "natural", "green", "herbal")
+            },
+            {
+                "text": "🔵 Синий и морские оттенки",
+                "value": "blue_marine",
+                "keywords": ("прохладный", "свежий", "cool", "aquatic", "marine")
+            },
+            {
+                "text": "⚫ Темные и глубокие цвета",
+                "value": "dark_deep",
+                "keywords": ("глубокий", "таинственный", "deep", "mysterious", "intense")
+            }
+        )
+    }
+)
+
+# Индекс ключевых слов: id вопроса -> значение опции -> ключевые слова (O(1) вместо перебора опций)
+_OPTION_KEYWORDS: Final[Dict[str, Dict[str, tuple]]] = {
+    question['id']: {option['value']: option.get('keywords', ()) for option in question['options']}
+    for question in _QUIZ_QUESTIONS
+}
+
+# Допустимые значения пола парфюма для выбранного пола клиента
+_GENDER_ALLOWED: Final[Dict[str, frozenset]] = {
+    'male': frozenset(('male', 'unisex', 'мужской')),
+    'female': frozenset(('female', 'unisex', 'женский')),
+}
+
+# Ключевые слова групп ароматов для фильтрации каталога
+_FAMILY_KEYWORDS: Final[Dict[str, tuple]] = {
+    'oriental': ('oriental', 'amber', 'vanilla', 'spicy', 'warm'),
+    'woody': ('woody', 'wood', 'cedar', 'sandalwood', 'forest'),
+    'fresh': ('fresh', 'citrus', 'aquatic', 'marine', 'light'),
+    'floral': ('floral', 'flower', 'rose', 'jasmine', 'peony')
+}
+
+# Канонические (интернированные) значения опций: строки из callback_data заменяются ими,
+# поэтому ответы в user_data ссылаются на общие объекты и сравниваются по указателю
+_INTERNED_OPTION_VALUES: Final[Dict[str, Dict[str, str]]] = {
+    sys.intern(question['id']): {
+        option['value']: sys.intern(option['value']) for option in question['options']
+    }
+    for question in _QUIZ_QUESTIONS
+}
+
 class QuizSystem:
     """Научно обоснованная система квизов на основе Edwards Fragrance Wheel"""
-    
+
+    # Фиксированный набор атрибутов - без per-instance __dict__
+    __slots__ = ("db", "ai_processor", "quiz_questions", "option_ids", "_edwards_cache")
+
+    # Число вопросов - константа класса вместо len() на каждом шаге
+    TOTAL_QUESTIONS: ClassVar[int] = len(_QUIZ_QUESTIONS)
+
     def __init__(self, db_manager, ai_processor=None):
         self.db = db_manager
         self.ai_processor = ai_processor
-        self.quiz_questions = self._initialize_quiz_questions()
+        self.quiz_questions = _QUIZ_QUESTIONS
+        self.option_ids = self._build_option_ids()
+        # Кэш анализа по набору ответов - одинаковые комбинации повторяются часто
+        self._edwards_cache = lru_cache(maxsize=4096)(self._analyze_answers_key)
         self._validate_quiz_structure()
         logger.info("📝 QuizSystem v3.0 (Edwards Fragrance Wheel) инициализирована")
     
@@ -185,8 +699,9 @@ class QuizSystem:
                 logger.error(f"❌ Ошибка при попытке {attempt + 1}/{max_retries} для квиза: {e}")
                 if attempt == max_retries - 1:
                     return "⚠️ ИИ-анализ временно недоступен. Ваш профиль сохранен!"
-                # Убираем задержки для максимальной скорости
-                # await asyncio.sleep(1)
+                # Retry-After от сервера или экспоненциальная задержка с джиттером
+                retry_after = e.retry_after if isinstance(e, RateLimitError) else None
+                await asyncio.sleep(self.ai_processor.retry_delay(attempt, retry_after))
                 continue
         
         return "❌ Не удалось получить ответ от ИИ после всех попыток"
@@ -194,497 +709,59 @@ class QuizSystem:
     @track_function("quiz_call_api_directly")
     async def _call_api_directly(self, prompt: str) -> str:
         """Прямой вызов API без таймаутов - только ожидание ответа"""
-        payload = {
-            "model": self.ai_processor.model,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "max_tokens": 4000,
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "frequency_penalty": 0.1,
-            "presence_penalty": 0.1
-        }
+        # Общие параметры запроса и URL берем из AIProcessor
+        payload = self.ai_processor.build_chat_payload(prompt)
         
-        # Создаем сессию без таймаутов
-        async with aiohttp.ClientSession(
-            headers={
-                "Authorization": f"Bearer {self.ai_processor.api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://perfume-bot.local",
-                "X-Title": "Perfume Bot"
-            }
-            # Убираем таймаут - пусть работает без ограничений
-        ) as session:
+        # Общая сессия AIProcessor (keep-alive соединения с OpenRouter) и разбор ответа через orjson
+        data = await self.ai_processor.post_chat_completion(payload)
+        
+        if 'choices' in data and len(data['choices']) > 0:
+            content = data['choices'][0]['message']['content']
             
-            async with session.post(f"{self.ai_processor.base_url}/chat/completions", json=payload) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    if 'choices' in data and len(data['choices']) > 0:
-                        content = data['choices'][0]['message']['content']
-                        
-                        # Логируем использование токенов
-                        usage = data.get('usage', {})
-                        total_tokens = usage.get('total_tokens', 0)
-                        logger.info(f"✅ Получен ответ от ИИ для квиза ({total_tokens} токенов)")
-                        
-                        return content
-                    else:
-                        raise Exception("Неожиданная структура ответа от OpenRouter API")
-                        
-                elif response.status == 429:
-                    raise Exception("Rate limit превышен для OpenRouter API")
-                    
-                elif response.status >= 500:
-                    error_text = await response.text()
-                    raise Exception(f"Серверная ошибка OpenRouter API ({response.status}): {error_text[:200]}")
-                    
-                else:
-                    error_text = await response.text()
-                    raise Exception(f"Ошибка OpenRouter API ({response.status}): {error_text}")
-    
-    def _initialize_quiz_questions(self) -> List[Dict[str, Any]]:
-        """Инициализирует 15 научно обоснованных вопросов квиза"""
-        return [
-            # БЛОК 1: ДЕМОГРАФИЧЕСКИЙ (2 вопроса)
-            {
-                "id": "gender",
-                "block": "demographic",
-                "question": "👤 **Для кого предназначен аромат?**",
-                "type": "single_choice",
-                "options": [
-                    {
-                        "text": "👩 Для меня (женщина)",
-                        "value": "female",
-                        "keywords": ["женский", "feminine", "floral", "delicate"]
-                    },
-                    {
-                        "text": "👨 Для меня (мужчина)",
-                        "value": "male",
-                        "keywords": ["мужской", "masculine", "woody", "strong"]
-                    },
-                    {
-                        "text": "🌈 Унисекс",
-                        "value": "unisex",
-                        "keywords": ["унисекс", "unisex", "neutral", "balanced"]
-                    }
-                ]
-            },
-            {
-                "id": "age_experience",
-                "block": "demographic",
-                "question": "🎓 **Ваш опыт с парфюмерией?**",
-                "type": "single_choice",
-                "options": [
-                    {
-                        "text": "🌱 Новичок (первые ароматы)",
-                        "value": "beginner",
-                        "keywords": ["легкий", "простой", "классический", "популярный", "безопасный"]
-                    },
-                    {
-                        "text": "🌿 Имею базовый опыт",
-                        "value": "intermediate",
-                        "keywords": ["современный", "трендовый", "качественный", "сбалансированный"]
-                    },
-                    {
-                        "text": "🌳 Продвинутый (коллекционер)",
-                        "value": "advanced",
-                        "keywords": ["нишевый", "эксклюзивный", "сложный", "уникальный", "артистический"]
-                    }
-                ]
-            },
+            # Логируем использование токенов
+            usage = data.get('usage', {})
+            total_tokens = usage.get('total_tokens', 0)
+            logger.info(f"✅ Получен ответ от ИИ для квиза ({total_tokens} токенов)")
+            
+            return content
+        else:
+            raise Exception("Неожиданная структура ответа от OpenRouter API")
 
-            # БЛОК 2: ПСИХОЛОГИЧЕСКИЙ (3 вопроса)
-            {
-                "id": "personality_type",
-                "block": "psychological",
-                "question": "🧠 **Какой тип личности вам ближе?**",
-                "type": "single_choice",
-                "options": [
-                    {
-                        "text": "💕 Романтик",
-                        "value": "romantic",
-                        "keywords": ["романтичный", "чувственный", "нежный", "floral", "rose", "jasmine"]
-                    },
-                    {
-                        "text": "🎓 Интеллектуал",
-                        "value": "intellectual",
-                        "keywords": ["сложный", "утонченный", "изысканный", "green", "herbaceous"]
-                    },
-                    {
-                        "text": "🎉 Экстраверт",
-                        "value": "extrovert",
-                        "keywords": ["яркий", "заметный", "bold", "oriental", "spicy"]
-                    },
-                    {
-                        "text": "🤫 Интроверт",
-                        "value": "introvert",
-                        "keywords": ["спокойный", "деликатный", "subtle", "woody", "musky"]
-                    },
-                    {
-                        "text": "🔬 Логик-аналитик",
-                        "value": "analytical",
-                        "keywords": ["структурированный", "чистый", "minimalistic", "aquatic", "ozonic"]
-                    }
-                ]
-            },
-            {
-                "id": "lifestyle",
-                "block": "psychological", 
-                "question": "🏃 **Опишите ваш образ жизни:**",
-                "type": "single_choice",
-                "options": [
-                    {
-                        "text": "⚡ Активный и динамичный",
-                        "value": "active",
-                        "keywords": ["энергичный", "спортивный", "fresh", "citrus", "energizing"]
-                    },
-                    {
-                        "text": "🧘 Спокойный и размеренный",
-                        "value": "calm",
-                        "keywords": ["расслабляющий", "мягкий", "comforting", "vanilla", "amber"]
-                    },
-                    {
-                        "text": "🎨 Творческий и артистичный",
-                        "value": "creative",
-                        "keywords": ["креативный", "необычный", "artistic", "incense", "patchouli"]
-                    },
-                    {
-                        "text": "💼 Деловой и профессиональный",
-                        "value": "professional",
-                        "keywords": ["строгий", "элегантный", "sophisticated", "cedar", "sandalwood"]
-                    }
-                ]
-            },
-            {
-                "id": "usage_time",
-                "block": "psychological",
-                "question": "⏰ **В какое время дня планируете использовать аромат?**",
-                "type": "multiple_choice",
-                "options": [
-                    {
-                        "text": "🌅 Утром и днем",
-                        "value": "day",
-                        "keywords": ["дневной", "light", "fresh", "citrus", "green"]
-                    },
-                    {
-                        "text": "🌃 Вечером",
-                        "value": "evening",
-                        "keywords": ["вечерний", "intense", "oriental", "woody", "amber"]
-                    },
-                    {
-                        "text": "✨ На особые случаи",
-                        "value": "special",
-                        "keywords": ["праздничный", "luxurious", "sophisticated", "oud", "rare"]
-                    },
-                    {
-                        "text": "🔄 Универсально",
-                        "value": "universal",
-                        "keywords": ["универсальный", "versatile", "balanced", "moderate"]
-                    }
-                ]
-            },
+    def _build_option_ids(self) -> Dict[str, Dict[str, int]]:
+        """Строит индекс значение опции -> порядковый номер для каждого вопроса"""
+        for question in self.quiz_questions:
+            if len(question['options']) > _MAX_ENCODED_OPTIONS:
+                raise ValueError(f"Вопрос {question['id']}: больше {_MAX_ENCODED_OPTIONS} опций не помещается в вектор ответов")
+        return {
+            question['id']: {option['value']: i for i, option in enumerate(question['options'])}
+            for question in self.quiz_questions
+        }
 
-            # БЛОК 3: LIFESTYLE (4 вопроса)
-            {
-                "id": "occasions",
-                "block": "lifestyle",
-                "question": "🎭 **Для каких случаев нужен аромат?**",
-                "type": "multiple_choice",
-                "options": [
-                    {
-                        "text": "🏢 Повседневная работа/учеба",
-                        "value": "work",
-                        "keywords": ["офисный", "деликатный", "professional", "clean", "subtle"]
-                    },
-                    {
-                        "text": "💕 Романтические встречи",
-                        "value": "romantic",
-                        "keywords": ["соблазнительный", "чувственный", "seductive", "rose", "ylang-ylang"]
-                    },
-                    {
-                        "text": "🎉 Вечеринки и мероприятия",
-                        "value": "party",
-                        "keywords": ["яркий", "запоминающийся", "party", "gourmand", "sweet"]
-                    },
-                    {
-                        "text": "🏃 Спорт и активность",
-                        "value": "sport",
-                        "keywords": ["свежий", "легкий", "sport", "aquatic", "marine"]
-                    },
-                    {
-                        "text": "🛋️ Отдых и релакс",
-                        "value": "relaxation",
-                        "keywords": ["успокаивающий", "комфортный", "relaxing", "lavender", "chamomile"]
-                    }
-                ]
-            },
-            {
-                "id": "style_preference",
-                "block": "lifestyle",
-                "question": "👔 **Ваш стиль в одежде:**",
-                "type": "single_choice",
-                "options": [
-                    {
-                        "text": "👑 Классический и элегантный",
-                        "value": "classic",
-                        "keywords": ["классический", "элегантный", "timeless", "chypre", "aldehydic"]
-                    },
-                    {
-                        "text": "🔥 Модный и трендовый",
-                        "value": "trendy",
-                        "keywords": ["модный", "современный", "trendy", "fruity", "synthetic"]
-                    },
-                    {
-                        "text": "👕 Casual и комфортный",
-                        "value": "casual",
-                        "keywords": ["простой", "комфортный", "easy-going", "cotton", "clean"]
-                    },
-                    {
-                        "text": "⚡ Экстравагантный и яркий",
-                        "value": "bold",
-                        "keywords": ["яркий", "смелый", "extravagant", "leather", "tobacco"]
-                    }
-                ]
-            },
-            {
-                "id": "budget_category",
-                "block": "lifestyle",
-                "question": "💰 **Предпочтительная ценовая категория:**",
-                "type": "single_choice",
-                "options": [
-                    {
-                        "text": "💸 Доступная (масс-маркет)",
-                        "value": "mass_market",
-                        "keywords": ["популярный", "доступный", "commercial", "mainstream"]
-                    },
-                    {
-                        "text": "💎 Средняя (селективная)",
-                        "value": "selective",
-                        "keywords": ["качественный", "селективный", "premium", "boutique"]
-                    },
-                    {
-                        "text": "👑 Высокая (люкс/нишевая)",
-                        "value": "luxury",
-                        "keywords": ["люксовый", "нишевый", "luxury", "exclusive", "artisanal"]
-                    }
-                ]
-            },
-            {
-                "id": "longevity_preference",
-                "block": "lifestyle",
-                "question": "⏱️ **Предпочтительная стойкость аромата:**",
-                "type": "single_choice",
-                "options": [
-                    {
-                        "text": "🌸 Легкий и ненавязчивый (2-4 часа)",
-                        "value": "light",
-                        "keywords": ["легкий", "деликатный", "eau_de_cologne", "citrus", "aromatic"]
-                    },
-                    {
-                        "text": "⚖️ Умеренной стойкости (4-6 часов)",
-                        "value": "moderate",
-                        "keywords": ["умеренный", "сбалансированный", "eau_de_toilette", "balanced"]
-                    },
-                    {
-                        "text": "💪 Стойкий и насыщенный (8+ часов)",
-                        "value": "long_lasting",
-                        "keywords": ["стойкий", "насыщенный", "eau_de_parfum", "intense", "heavy"]
-                    }
-                ]
-            },
+    def encode_answers(self, quiz_answers: Dict) -> array:
+        """Кодирует ответы квиза в вектор uint16 длиной в число вопросов
 
-            # БЛОК 4: СЕНСОРНЫЙ (3 вопроса) - Edwards Fragrance Wheel
-            {
-                "id": "fragrance_families",
-                "block": "sensory",
-                "question": "🌸 **Какие ароматические семейства вам нравятся? (Edwards Wheel)**",
-                "type": "multiple_choice",
-                "options": [
-                    {
-                        "text": "🌸 Цветочные (роза, жасмин, пион)",
-                        "value": "floral",
-                        "keywords": ["floral", "rose", "jasmine", "peony", "lily", "romantic"]
-                    },
-                    {
-                        "text": "🌟 Восточные/Амбровые (ваниль, амбра, мускус)",
-                        "value": "oriental",
-                        "keywords": ["oriental", "amber", "vanilla", "musk", "resin", "warm"]
-                    },
-                    {
-                        "text": "🌳 Древесные (сандал, кедр, дуб)",
-                        "value": "woody",
-                        "keywords": ["woody", "sandalwood", "cedar", "oak", "pine", "forest"]
-                    },
-                    {
-                        "text": "💧 Свежие (цитрус, зеленые, водные)",
-                        "value": "fresh",
-                        "keywords": ["fresh", "citrus", "green", "aquatic", "marine", "clean"]
-                    }
-                ]
-            },
-            {
-                "id": "intensity_preference",
-                "block": "sensory",
-                "question": "📶 **Предпочтительная интенсивность аромата:**",
-                "type": "single_choice",
-                "options": [
-                    {
-                        "text": "🌸 Деликатная и тонкая",
-                        "value": "delicate",
-                        "keywords": ["деликатный", "тонкий", "subtle", "soft", "gentle"]
-                    },
-                    {
-                        "text": "⚖️ Умеренная и сбалансированная",
-                        "value": "moderate",
-                        "keywords": ["умеренный", "сбалансированный", "moderate", "balanced"]
-                    },
-                    {
-                        "text": "🔥 Яркая и насыщенная",
-                        "value": "intense",
-                        "keywords": ["яркий", "насыщенный", "intense", "bold", "powerful"]
-                    }
-                ]
-            },
-            {
-                "id": "seasonal_preference",
-                "block": "sensory",
-                "question": "🌍 **В какие сезоны планируете носить аромат?**",
-                "type": "multiple_choice",
-                "options": [
-                    {
-                        "text": "🌸 Весна",
-                        "value": "spring",
-                        "keywords": ["весенний", "свежий", "green", "floral", "light"]
-                    },
-                    {
-                        "text": "☀️ Лето",
-                        "value": "summer",
-                        "keywords": ["летний", "легкий", "citrus", "aquatic", "fresh"]
-                    },
-                    {
-                        "text": "🍂 Осень",
-                        "value": "autumn",
-                        "keywords": ["осенний", "теплый", "spicy", "woody", "amber"]
-                    },
-                    {
-                        "text": "❄️ Зима",
-                        "value": "winter",
-                        "keywords": ["зимний", "согревающий", "oriental", "heavy", "intense"]
-                    }
-                ]
-            },
+        single_choice -> индекс опции, multiple_choice -> битовая маска опций,
+        отсутствующий ответ -> 0xFFFF. Буфер совместим с numpy.frombuffer(..., dtype=uint16).
+        """
+        encoded = array('H', [_MISSING_ANSWER_CODE]) * self.TOTAL_QUESTIONS
 
-            # БЛОК 5: ЭМОЦИОНАЛЬНО-АССОЦИАТИВНЫЙ (3 вопроса)
-            {
-                "id": "desired_mood",
-                "block": "emotional",
-                "question": "😊 **Какие настроения и эмоции хотите передать?**",
-                "type": "multiple_choice",
-                "options": [
-                    {
-                        "text": "💪 Уверенность и силу",
-                        "value": "confidence",
-                        "keywords": ["уверенный", "сильный", "powerful", "dominant", "leader"]
-                    },
-                    {
-                        "text": "💕 Романтику и нежность",
-                        "value": "romance",
-                        "keywords": ["романтичный", "нежный", "romantic", "tender", "loving"]
-                    },
-                    {
-                        "text": "👑 Элегантность и изысканность",
-                        "value": "elegance",
-                        "keywords": ["элегантный", "изысканный", "sophisticated", "refined", "classy"]
-                    },
-                    {
-                        "text": "⚡ Энергию и жизнерадостность",
-                        "value": "energy",
-                        "keywords": ["энергичный", "жизнерадостный", "energetic", "vibrant", "happy"]
-                    },
-                    {
-                        "text": "🧘 Спокойствие и гармонию",
-                        "value": "calm",
-                        "keywords": ["спокойный", "гармоничный", "peaceful", "serene", "balanced"]
-                    }
-                ]
-            },
-            {
-                "id": "scent_memories",
-                "block": "emotional",
-                "question": "🌺 **Какие ароматические воспоминания вам приятны?**",
-                "type": "multiple_choice",
-                "options": [
-                    {
-                        "text": "🌷 Цветущий сад весной",
-                        "value": "garden",
-                        "keywords": ["цветочный", "природный", "garden", "blooming", "natural"]
-                    },
-                    {
-                        "text": "🏠 Уютный дом с выпечкой",
-                        "value": "home_comfort",
-                        "keywords": ["уютный", "сладкий", "gourmand", "vanilla", "caramel"]
-                    },
-                    {
-                        "text": "🌲 Прогулка по лесу",
-                        "value": "forest",
-                        "keywords": ["лесной", "древесный", "forest", "pine", "earthy"]
-                    },
-                    {
-                        "text": "🌊 Морской берег",
-                        "value": "ocean",
-                        "keywords": ["морской", "свежий", "marine", "salty", "breeze"]
-                    },
-                    {
-                        "text": "🕌 Восточный базар",
-                        "value": "oriental_market",
-                        "keywords": ["восточный", "пряный", "spicy", "exotic", "incense"]
-                    }
-                ]
-            },
-            {
-                "id": "color_associations",
-                "block": "emotional",
-                "question": "🎨 **Какие цвета ассоциируются с вашим идеальным ароматом?**",
-                "type": "multiple_choice",
-                "options": [
-                    {
-                        "text": "⚪ Белый и светлые оттенки",
-                        "value": "white_light",
-                        "keywords": ["чистый", "невинный", "clean", "pure", "innocent"]
-                    },
-                    {
-                        "text": "🌸 Розовый и персиковый",
-                        "value": "pink_peach",
-                        "keywords": ["нежный", "женственный", "gentle", "feminine", "soft"]
-                    },
-                    {
-                        "text": "🟡 Золотой и янтарный",
-                        "value": "gold_amber",
-                        "keywords": ["теплый", "роскошный", "warm", "luxurious", "rich"]
-                    },
-                    {
-                        "text": "🟢 Зеленый и природные тона",
-                        "value": "green_natural",
-                        "keywords": ["природный", "свежий", "natural", "green", "herbal"]
-                    },
-                    {
-                        "text": "🔵 Синий и морские оттенки",
-                        "value": "blue_marine",
-                        "keywords": ["прохладный", "свежий", "cool", "aquatic", "marine"]
-                    },
-                    {
-                        "text": "⚫ Темные и глубокие цвета",
-                        "value": "dark_deep",
-                        "keywords": ["глубокий", "таинственный", "deep", "mysterious", "intense"]
-                    }
-                ]
-            }
-        ]
+        for i, question in enumerate(self.quiz_questions):
+            answer = quiz_answers.get(question['id'])
+            if not answer:
+                continue
+
+            option_ids = self.option_ids[question['id']]
+            if isinstance(answer, list):
+                mask = 0
+                for value in answer:
+                    if value in option_ids:
+                        mask |= 1 << option_ids[value]
+                if mask:
+                    encoded[i] = mask
+            elif answer in option_ids:
+                encoded[i] = option_ids[answer]
+
+        return encoded
 
     def _validate_quiz_structure(self):
         """Валидирует структуру квиза на наличие потенциальных проблем с callback'ами"""
@@ -718,6 +795,11 @@ class QuizSystem:
                 # Проверяем пустые значения
                 if not option['value']:
                     issues.append(f"Пустое значение опции в {question['id']}")
+                
+                # Ключевые слова должны быть в нижнем регистре - анализ их не нормализует
+                for keyword in option.get('keywords', ()):
+                    if keyword != keyword.lower():
+                        issues.append(f"Ключевое слово '{keyword}' в {question['id']} не в нижнем регистре")
         
         if issues:
             logger.warning(f"Найдены проблемы в структуре квиза: {issues}")
@@ -747,7 +829,11 @@ class QuizSystem:
         current_step = context.user_data.get('quiz_step', 0)
         current_answers = context.user_data.get('quiz_answers', {})
         
-        logger.info(f"Quiz callback: user={user_id}, step={current_step}, data={query.data}, current_question={self.quiz_questions[current_step]['id'] if current_step < len(self.quiz_questions) else 'N/A'}")
+        # Диагностика на каждый callback - только в DEBUG, без форматирования при выключенном уровне
+        if logger.isEnabledFor(logging.DEBUG):
+            current_question = self.quiz_questions[current_step]['id'] if current_step < self.TOTAL_QUESTIONS else 'N/A'
+            logger.debug("Quiz callback: user=%s, step=%s, data=%s, current_question=%s",
+                         user_id, current_step, query.data, current_question)
         
         # Отвечаем на callback query чтобы убрать "часики" в интерфейсе
         try:
@@ -759,13 +845,13 @@ class QuizSystem:
             if query.data == "quiz_next":
                 # Переход к следующему вопросу
                 next_step = current_step + 1
-                logger.info(f"Moving to next step: {current_step} -> {next_step}")
-                if next_step < len(self.quiz_questions):
+                logger.debug("Moving to next step: %s -> %s", current_step, next_step)
+                if next_step < self.TOTAL_QUESTIONS:
                     context.user_data['quiz_step'] = next_step
-                    logger.info(f"Updated quiz_step to {next_step}")
+                    logger.debug("Updated quiz_step to %s", next_step)
                     await self._send_question(update, context, next_step)
                 else:
-                    logger.info(f"Quiz finished, showing results")
+                    logger.debug("Quiz finished, showing results")
                     await self._finish_quiz(update, context, current_answers)
                     
             elif query.data == "quiz_finish":
@@ -792,15 +878,22 @@ class QuizSystem:
                         return
                     
                     # Проверяем что current_step корректный
-                    if current_step >= len(self.quiz_questions):
-                        logger.error(f"Invalid step: {current_step} >= {len(self.quiz_questions)}")
+                    if current_step >= self.TOTAL_QUESTIONS:
+                        logger.error(f"Invalid step: {current_step} >= {self.TOTAL_QUESTIONS}")
                         return
                     
                     question = self.quiz_questions[current_step]
                     
                     # Проверяем что question_id соответствует текущему вопросу
                     if question['id'] == question_id:
-                        logger.info(f"Processing answer: {question_id} = {answer_value}")
+                        # Берем канонические строки вместо новых объектов из callback_data
+                        question_id = question['id']
+                        answer_value = _INTERNED_OPTION_VALUES[question_id].get(answer_value)
+                        if answer_value is None:
+                            logger.warning(f"Unknown option for {question_id}: {parts[2]}")
+                            return
+                        
+                        logger.debug("Processing answer: %s = %s", question_id, answer_value)
                         if question['type'] == 'single_choice':
                             current_answers[question_id] = answer_value
                         elif question['type'] == 'multiple_choice':
@@ -813,7 +906,7 @@ class QuizSystem:
                                 current_answers[question_id].append(answer_value)
                         
                         context.user_data['quiz_answers'] = current_answers
-                        logger.info(f"Updated answers: {current_answers}")
+                        logger.debug("Updated answers: %s", current_answers)
                         
                         # Обновляем отображение текущего вопроса
                         await self._send_question(update, context, current_step)
@@ -842,7 +935,7 @@ class QuizSystem:
 
     async def _send_question(self, update: Update, context: ContextTypes.DEFAULT_TYPE, step: int):
         """Отправляет вопрос пользователю"""
-        if step >= len(self.quiz_questions):
+        if step >= self.TOTAL_QUESTIONS:
             return
             
         question = self.quiz_questions[step]
@@ -871,7 +964,7 @@ class QuizSystem:
         # Кнопка "Далее" (только если есть ответ на обязательный вопрос)
         has_answer = question['id'] in current_answers and bool(current_answers[question['id']])
         if has_answer:
-            if step < len(self.quiz_questions) - 1:
+            if step < self.TOTAL_QUESTIONS - 1:
                 control_buttons.append(InlineKeyboardButton("➡️ Далее", callback_data="quiz_next"))
             else:
                 control_buttons.append(InlineKeyboardButton("🏁 Завершить квиз", callback_data="quiz_finish"))
@@ -887,18 +980,9 @@ class QuizSystem:
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        # Определяем блок вопроса
-        block_labels = {
-            'demographic': '1️⃣ Демографический блок',
-            'psychological': '2️⃣ Психологический блок', 
-            'lifestyle': '3️⃣ Lifestyle блок',
-            'sensory': '4️⃣ Сенсорный блок (Edwards Wheel)',
-            'emotional': '5️⃣ Эмоционально-ассоциативный блок'
-        }
-        
         # Формируем текст вопроса
-        progress = f"Вопрос {step + 1} из {len(self.quiz_questions)}"
-        block_info = block_labels.get(question['block'], '')
+        progress = f"Вопрос {step + 1} из {self.TOTAL_QUESTIONS}"
+        block_info = BLOCK_LABELS.get(question['block'], '')
         
         if question['type'] == 'multiple_choice':
             instruction = "\n💡 *Можно выбрать несколько вариантов*"
@@ -910,7 +994,7 @@ class QuizSystem:
         # Отправляем или редактируем сообщение
         if update.callback_query and update.callback_query.message:
             try:
-                logger.info(f"Attempting to edit message for step {step}")
+                logger.debug("Attempting to edit message for step %s", step)
                 
                 # Безопасно подготавливаем текст вопроса
                 safe_question_text = self._safe_send_message(question_text)
@@ -923,19 +1007,19 @@ class QuizSystem:
                         reply_markup=reply_markup,
                         parse_mode='Markdown'
                     )
-                    logger.info(f"Successfully edited message for step {step}")
+                    logger.debug("Successfully edited message for step %s", step)
                 else:
                     # Если текст не изменился, обновляем только клавиатуру
                     await update.callback_query.edit_message_reply_markup(
                         reply_markup=reply_markup
                     )
-                    logger.info(f"Successfully updated keyboard for step {step}")
+                    logger.debug("Successfully updated keyboard for step %s", step)
             except Exception as e:
                 logger.error(f"Ошибка при редактировании сообщения квиза: {e}")
                 # НЕ отправляем новое сообщение, это создает дубликаты
                 logger.error(f"Failed to edit message, this may cause UI issues")
         else:
-            logger.info(f"Sending new message for step {step}")
+            logger.debug("Sending new message for step %s", step)
             safe_question_text = self._safe_send_message(question_text)
             await update.message.reply_text(
                 text=safe_question_text,
@@ -994,13 +1078,6 @@ class QuizSystem:
                 ai_response = self.ai_processor.process_ai_response_with_links(ai_response_raw, self.db)
             
             # Формируем итоговое сообщение
-            family_names = {
-                'floral': 'Цветочные',
-                'oriental': 'Восточные/Амбровые', 
-                'woody': 'Древесные',
-                'fresh': 'Свежие'
-            }
-            
             result_text = f"""
 🎯 **Квиз завершен!**
 
@@ -1010,7 +1087,7 @@ class QuizSystem:
 🌳 Древесные: {analysis_result['edwards_analysis']['woody']}%
 💧 Свежие: {analysis_result['edwards_analysis']['fresh']}%
 
-**Доминирующее семейство:** {family_names.get(analysis_result['dominant_family'], analysis_result['dominant_family'])}
+**Доминирующее семейство:** {FAMILY_NAMES.get(analysis_result['dominant_family'], analysis_result['dominant_family'])}
 
 🤖 **Персональные рекомендации от ИИ-консультанта:**
 {ai_response}
@@ -1024,18 +1101,12 @@ class QuizSystem:
                 pass
             else:
                 # Создаем стандартное сообщение об ошибке
-                family_names = {
-                    'floral': 'Цветочные',
-                    'oriental': 'Восточные/Амбровые', 
-                    'woody': 'Древесные',
-                    'fresh': 'Свежие'
-                }
                 ai_response_raw = f"""
 ⚠️ **ИИ-анализ временно недоступен**
 Ваш профиль сохранен! Попробуйте пройти квиз позже для получения персональных рекомендаций от ИИ-консультанта.
 
 💡 **Ручные рекомендации на основе анализа:**
-Исходя из вашего доминирующего ароматического семейства "{family_names.get(analysis_result['dominant_family'], analysis_result['dominant_family'])}", рекомендуем обратить внимание на соответствующие категории ароматов в каталоге.
+Исходя из вашего доминирующего ароматического семейства "{FAMILY_NAMES.get(analysis_result['dominant_family'], analysis_result['dominant_family'])}", рекомендуем обратить внимание на соответствующие категории ароматов в каталоге.
                 """
         
         keyboard = [
@@ -1084,7 +1155,20 @@ class QuizSystem:
         logger.info(f"✅ Пользователь {user_id} завершил квиз. Доминирующее семейство: {analysis_result['dominant_family']}")
 
     def _analyze_quiz_answers_edwards(self, quiz_answers: Dict) -> Dict:
-        """Анализирует ответы квиза с помощью Edwards Fragrance Wheel"""
+        """Анализирует ответы квиза с помощью Edwards Fragrance Wheel (с кэшированием)"""
+        answers_key = tuple(sorted(
+            (question_id, tuple(value) if isinstance(value, list) else value)
+            for question_id, value in quiz_answers.items()
+        ))
+        # Поверхностная копия, чтобы вызывающий код не портил закэшированный результат
+        return dict(self._edwards_cache(answers_key))
+
+    def _analyze_answers_key(self, answers_key: tuple) -> Dict:
+        """Выполняет анализ для хэшируемого представления ответов"""
+        quiz_answers = {
+            question_id: list(value) if isinstance(value, tuple) else value
+            for question_id, value in answers_key
+        }
         
         # Собираем все ключевые слова из ответов
         all_keywords = []
@@ -1100,27 +1184,17 @@ class QuizSystem:
                 profile[question_id] = answer_values
                 
                 # Собираем ключевые слова
+                option_keywords = _OPTION_KEYWORDS[question_id]
                 for answer_value in answer_values:
-                    for option in question['options']:
-                        if option['value'] == answer_value:
-                            all_keywords.extend(option.get('keywords', []))
+                    all_keywords.extend(option_keywords.get(answer_value, ()))
         
         # Анализ по Edwards Fragrance Wheel
-        edwards_keywords = {
-            'floral': ['floral', 'rose', 'jasmine', 'peony', 'lily', 'romantic', 'feminine', 'gentle', 'нежный', 'романтичный', 'чувственный', 'женственный'],
-            'oriental': ['oriental', 'amber', 'vanilla', 'musk', 'warm', 'spicy', 'exotic', 'intense', 'теплый', 'пряный', 'восточный', 'насыщенный', 'согревающий'],
-            'woody': ['woody', 'sandalwood', 'cedar', 'forest', 'pine', 'earthy', 'masculine', 'древесный', 'лесной', 'мужской', 'строгий'],
-            'fresh': ['fresh', 'citrus', 'green', 'aquatic', 'marine', 'clean', 'light', 'свежий', 'легкий', 'морской', 'чистый', 'прохладный', 'дневной', 'летний', 'весенний']
-        }
-        
-        edwards_scores = {family: 0 for family in edwards_keywords.keys()}
+        edwards_scores = {family: 0 for family in _EDWARDS_KEYWORDS}
         
-        # Подсчитываем соответствия
+        # Подсчитываем соответствия (ключевые слова опций уже в нижнем регистре)
         for keyword in all_keywords:
-            keyword_lower = keyword.lower()
-            for family, family_keywords in edwards_keywords.items():
-                if keyword_lower in family_keywords:
-                    edwards_scores[family] += 1
+            for family in _KEYWORD_FAMILIES.get(keyword, ()):
+                edwards_scores[family] += 1
         
         # Вычисляем проценты
         total_score = sum(edwards_scores.values())
@@ -1130,7 +1204,7 @@ class QuizSystem:
                 for family, score in edwards_scores.items()
             }
         else:
-            edwards_percentages = {family: 0 for family in edwards_keywords.keys()}
+            edwards_percentages = {family: 0 for family in _EDWARDS_KEYWORDS}
         
         # Определяем доминирующее семейство
         dominant_family = max(edwards_percentages.keys(), key=lambda k: edwards_percentages[k])
@@ -1156,14 +1230,20 @@ class QuizSystem:
         budget = quiz_profile.get('budget_category', 'all')
         fragrance_families = quiz_profile.get('fragrance_families', [])
         
+        # Готовим критерии один раз, а не для каждого парфюма
+        # (профиль хранит ответы списками - фильтр по полу срабатывает только для строкового значения)
+        allowed_genders = _GENDER_ALLOWED.get(gender) if isinstance(gender, str) else None
+        family_needles = [
+            (family.lower(), self._get_family_keywords(family))
+            for family in fragrance_families
+        ]
+        
         for perfume in all_perfumes:
             should_include = True
             
             # Фильтр по полу
-            if gender != 'unisex' and perfume.get('gender'):
-                perfume_gender = perfume['gender'].lower()
-                if (gender == 'male' and perfume_gender not in ['male', 'unisex', 'мужской']) or \
-                   (gender == 'female' and perfume_gender not in ['female', 'unisex', 'женский']):
+            if allowed_genders and perfume.get('gender'):
+                if perfume['gender'].lower() not in allowed_genders:
                     should_include = False
             
             # Фильтр по бюджету (упрощенный)
@@ -1176,13 +1256,12 @@ class QuizSystem:
                         should_include = False
             
             # Фильтр по семействам ароматов (базовая проверка)
-            if fragrance_families and perfume.get('fragrance_group'):
+            if family_needles and perfume.get('fragrance_group'):
                 group = perfume['fragrance_group'].lower()
-                family_matches = False
-                for family in fragrance_families:
-                    if family.lower() in group or any(keyword in group for keyword in self._get_family_keywords(family)):
-                        family_matches = True
-                        break
+                family_matches = any(
+                    family in group or any(keyword in group for keyword in keywords)
+                    for family, keywords in family_needles
+                )
                 if not family_matches:
                     should_include = False
                     
@@ -1197,13 +1276,7 @@ class QuizSystem:
         logger.info(f"📊 Фильтрация: {len(all_perfumes)} -> {len(filtered)} парфюмов")
         return filtered
     
-    def _get_family_keywords(self, family: str) -> List[str]:
+    def _get_family_keywords(self, family: str) -> tuple:
         """Возвращает ключевые слова для семейства ароматов"""
-        keywords_map = {
-            'oriental': ['oriental', 'amber', 'vanilla', 'spicy', 'warm'],
-            'woody': ['woody', 'wood', 'cedar', 'sandalwood', 'forest'],
-            'fresh': ['fresh', 'citrus', 'aquatic', 'marine', 'light'],
-            'floral': ['floral', 'flower', 'rose', 'jasmine', 'peony']
-        }
-        return keywords_map.get(family.lower(), [])
+        return _FAMILY_KEYWORDS.get(family.lower(), ())
 
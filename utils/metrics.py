@@ -1,17 +1,45 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import sys
 import time
 import logging
-from typing import Dict, Any, Optional
-from datetime import datetime
+import functools
+import array
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta
 from dataclasses import dataclass, field
-from collections import defaultdict
 import asyncio
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Линейных подбакетов на каждую степень двойки (2^4 = 16): относительная погрешность не больше 1/16
+_SUB_BUCKET_BITS = 4
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+# Старшая степень двойки гистограммы (2^40 нс ~ 18 минут); более долгие вызовы - в последний бакет
+_MAX_EXPONENT = 40
+# Число бакетов лог-линейной гистограммы (в стиле HDR Histogram)
+_HISTOGRAM_BUCKETS = (_MAX_EXPONENT - _SUB_BUCKET_BITS + 2) * _SUB_BUCKETS
+
+def _empty_buckets() -> array.array:
+    """Создает пустую гистограмму (8 байт на бакет)"""
+    return array.array('Q', bytes(8 * _HISTOGRAM_BUCKETS))
+
+def _bucket_index(ns: int) -> int:
+    """Номер бакета: старший бит выбирает степень двойки, следующие биты - линейный подбакет"""
+    shift = ns.bit_length() - 1 - _SUB_BUCKET_BITS
+    if shift < 0:
+        return ns  # Меньше 2^4 нс - по бакету на каждую наносекунду
+    return min(((shift + 1) << _SUB_BUCKET_BITS) + (ns >> shift) - _SUB_BUCKETS, _HISTOGRAM_BUCKETS - 1)
+
+def _bucket_bounds(index: int) -> Tuple[int, int]:
+    """Нижняя граница бакета и его ширина в наносекундах"""
+    if index < _SUB_BUCKETS:
+        return index, 1
+    shift = (index >> _SUB_BUCKET_BITS) - 1
+    return (_SUB_BUCKETS + (index & (_SUB_BUCKETS - 1))) << shift, 1 << shift
+
+@dataclass(slots=True)
 class FunctionMetrics:
     """Метрики для одной функции"""
     function_name: str
@@ -22,6 +50,8 @@ class FunctionMetrics:
     last_call_time: Optional[datetime] = None
     last_execution_time: Optional[float] = None
     errors: int = 0
+    # Лог-линейная гистограмма длительностей успешных вызовов для перцентилей
+    buckets: array.array = field(default_factory=_empty_buckets, repr=False)
     
     @property
     def avg_time(self) -> float:
@@ -33,58 +63,91 @@ class FunctionMetrics:
         """Процент успешных вызовов"""
         total = self.total_calls + self.errors
         return (self.total_calls / total * 100) if total > 0 else 0.0
+    
+    def percentile(self, q: float) -> float:
+        """Оценка перцентиля по гистограмме (интерполяция внутри бакета, в пределах min/max)"""
+        if self.total_calls == 0:
+            return 0.0
+        
+        rank = q * self.total_calls
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                low, width = _bucket_bounds(i)
+                estimate = (low + width * (rank - seen) / count) * 1e-9
+                return min(max(estimate, self.min_time), self.max_time)
+            seen += count
+        return self.max_time
 
 class MetricsCollector:
     """Сборщик метрик для отслеживания производительности"""
     
     def __init__(self):
-        self.metrics: Dict[str, FunctionMetrics] = defaultdict(lambda: FunctionMetrics(""))
-        self._lock = asyncio.Lock()
+        # Обычный dict: записи создаются явно в _record_metric с именем функции
+        self.metrics: Dict[str, FunctionMetrics] = {}
     
-    async def track_function(self, function_name: str, func, *args, **kwargs):
-        """Отслеживает выполнение функции с метриками"""
-        start_time = time.time()
-        start_datetime = datetime.now()
+    async def track_async(self, function_name: str, func, *args, **kwargs):
+        """Отслеживает выполнение асинхронной функции с метриками"""
+        # Монотонный счетчик в наносекундах - без скачков системных часов
+        start_ns = time.perf_counter_ns()
         
         try:
-            # Выполняем функцию
-            if asyncio.iscoroutinefunction(func):
-                result = await func(*args, **kwargs)
-            else:
-                result = func(*args, **kwargs)
-            
-            # Записываем успешную метрику
-            execution_time = time.time() - start_time
-            await self._record_metric(function_name, execution_time, start_datetime, success=True)
-            
-            return result
-            
+            result = await func(*args, **kwargs)
         except Exception as e:
             # Записываем метрику ошибки
-            execution_time = time.time() - start_time
-            await self._record_metric(function_name, execution_time, start_datetime, success=False)
+            self._record_metric(function_name, time.perf_counter_ns() - start_ns, success=False)
             logger.error(f"Ошибка в функции {function_name}: {e}")
             raise
+        
+        # Записываем успешную метрику
+        self._record_metric(function_name, time.perf_counter_ns() - start_ns, success=True)
+        return result
+    
+    def track_sync(self, function_name: str, func, *args, **kwargs):
+        """Отслеживает выполнение синхронной функции с метриками"""
+        start_ns = time.perf_counter_ns()
+        
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._record_metric(function_name, time.perf_counter_ns() - start_ns, success=False)
+            logger.error(f"Ошибка в функции {function_name}: {e}")
+            raise
+        
+        self._record_metric(function_name, time.perf_counter_ns() - start_ns, success=True)
+        return result
     
-    async def _record_metric(self, function_name: str, execution_time: float, 
-                           call_time: datetime, success: bool = True):
-        """Записывает метрику выполнения функции"""
-        async with self._lock:
-            if function_name not in self.metrics:
-                self.metrics[function_name] = FunctionMetrics(function_name)
-            
-            metric = self.metrics[function_name]
-            
-            if success:
-                metric.total_calls += 1
-                metric.total_time += execution_time
-                metric.min_time = min(metric.min_time, execution_time)
-                metric.max_time = max(metric.max_time, execution_time)
-            else:
-                metric.errors += 1
-            
-            metric.last_call_time = call_time
-            metric.last_execution_time = execution_time
+    async def track_function(self, function_name: str, func, *args, **kwargs):
+        """Отслеживает выполнение функции любого типа (для обратной совместимости)"""
+        if asyncio.iscoroutinefunction(func):
+            return await self.track_async(function_name, func, *args, **kwargs)
+        return self.track_sync(function_name, func, *args, **kwargs)
+    
+    def _record_metric(self, function_name: str, execution_ns: int, success: bool = True):
+        """Записывает метрику выполнения функции
+        
+        Без блокировки: вызывается из event loop без await внутри, поэтому обновление атомарно.
+        """
+        if function_name not in self.metrics:
+            self.metrics[function_name] = FunctionMetrics(function_name)
+        
+        metric = self.metrics[function_name]
+        execution_time = execution_ns * 1e-9
+        
+        if success:
+            metric.total_calls += 1
+            metric.total_time += execution_time
+            metric.buckets[_bucket_index(execution_ns)] += 1
+            if execution_time < metric.min_time:
+                metric.min_time = execution_time
+            if execution_time > metric.max_time:
+                metric.max_time = execution_time
+        else:
+            metric.errors += 1
+        
+        # Время начала вызова восстанавливаем только здесь, а не на каждом старте
+        metric.last_call_time = datetime.now() - timedelta(seconds=execution_time)
+        metric.last_execution_time = execution_time
     
     def get_function_metrics(self, function_name: str) -> Optional[FunctionMetrics]:
         """Получает метрики для конкретной функции"""
@@ -110,6 +173,9 @@ class MetricsCollector:
                 'avg_time': round(metric.avg_time, 3),
                 'min_time': round(metric.min_time, 3) if metric.min_time != float('inf') else 0,
                 'max_time': round(metric.max_time, 3),
+                'p50_time': round(metric.percentile(0.50), 3),
+                'p95_time': round(metric.percentile(0.95), 3),
+                'p99_time': round(metric.percentile(0.99), 3),
                 'success_rate': round(metric.success_rate, 1),
                 'errors': metric.errors,
                 'last_call': metric.last_call_time.isoformat() if metric.last_call_time else None,
@@ -127,16 +193,21 @@ metrics_collector = MetricsCollector()
 
 def track_function(function_name: str):
     """Декоратор для отслеживания функции"""
+    # Интернированное имя: поиск в self.metrics сравнивает ключи по указателю
+    function_name = sys.intern(function_name)
+    
     def decorator(func):
-        async def async_wrapper(*args, **kwargs):
-            return await metrics_collector.track_function(function_name, func, *args, **kwargs)
-        
-        def sync_wrapper(*args, **kwargs):
-            return metrics_collector.track_function(function_name, func, *args, **kwargs)
-        
+        # Тип функции определяется один раз при декорировании, а не на каждом вызове
         if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await metrics_collector.track_async(function_name, func, *args, **kwargs)
             return async_wrapper
-        else:
-            return sync_wrapper
+        
+        # Синхронная функция остается синхронной: вызывающий код получает результат, а не корутину
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            return metrics_collector.track_sync(function_name, func, *args, **kwargs)
+        return sync_wrapper
     
-    return decorator
\ No newline at end of file
+    return decorator